@@ -0,0 +1,130 @@
+"""Modo assíncrono (ASGI) do Lêle.
+
+As rotas de leitura e polling que mais ocupam threads (/api/mensagens, /api/usuarios_online,
+/pedidos/lele_data e o catálogo de /cardapio) são atendidas no event loop, com o cliente PostgREST
+assíncrono: uma consulta esperando o Supabase não segura uma thread. As demais rotas continuam no app
+Flask de lele.py, rodando num pool de threads pelo a2wsgi.
+
+    gunicorn --bind :8080 --workers 2 --worker-class uvicorn.workers.UvicornWorker --timeout 0 asgi:app
+
+As consultas são montadas pelas mesmas funções usadas no Flask (consulta_mensagens, consultas_cozinha,
+consulta_catalogo),
+então as duas versões de cada rota devolvem a mesma coisa.
+"""
+import asyncio
+import inspect
+import logging
+import os
+from urllib.parse import parse_qs
+
+from a2wsgi import WSGIMiddleware
+
+import lele
+from dados import LELE_BACKEND, criar_cliente_assincrono
+
+# Threads para as rotas que continuam síncronas (inclui as conexões SSE abertas)
+ASGI_THREADS_WSGI = int(os.getenv('ASGI_THREADS_WSGI', 16))
+
+flask_app = WSGIMiddleware(lele.app, workers=ASGI_THREADS_WSGI)
+# O banco local (dados_local.py) é síncrono: as consultas dele rodam numa thread
+supabase_async = lele.supabase if LELE_BACKEND == 'sqlite' else criar_cliente_assincrono(lele.SUPABASE_URL, lele.SUPABASE_KEY)
+
+
+async def executar(consulta):
+    """Executa uma consulta do cliente assíncrono (ou do banco local, numa thread)"""
+    if inspect.iscoroutinefunction(consulta.execute):
+        return await consulta.execute()
+    return await asyncio.to_thread(consulta.execute)
+
+
+async def responder(send, status, corpo=b'', tipo='application/json', cabecalhos=()):
+    headers = [(b'content-type', tipo.encode()), (b'content-length', str(len(corpo)).encode())]
+    headers += [(nome.encode(), valor.encode()) for nome, valor in cabecalhos]
+    await send({'type': 'http.response.start', 'status': status, 'headers': headers})
+    await send({'type': 'http.response.body', 'body': corpo})
+
+
+async def responder_json(send, dados, status=200):
+    await responder(send, status, lele.app.json.dumps(dados).encode('utf-8'))
+
+
+def argumentos(scope):
+    return {chave: valores[0] for chave, valores in parse_qs(scope.get('query_string', b'').decode()).items()}
+
+
+def inteiro(valor):
+    try:
+        return int(valor) if valor is not None else None
+    except ValueError:
+        return None
+
+
+async def listar_mensagens(scope, receive, send):
+    args = argumentos(scope)
+    if not args.get('chat_id'):
+        return await responder_json(send, {"error": "chat_id obrigatório"}, 400)
+    data = await executar(lele.consulta_mensagens(supabase_async, args['chat_id'], inteiro(args.get('after_id')), args.get('after_created_at')))
+    await responder_json(send, data.data)
+
+
+async def usuarios_online(scope, receive, send):
+    # Quase sempre só memória e o arquivo de eventos; a cada PRESENCA_SINCRONIZAR segundos relê o banco
+    corpo, etag = await asyncio.to_thread(lele.corpo_usuarios_online)
+    cabecalhos = [('etag', f'"{etag}"'), ('cache-control', 'no-cache')]
+    if_none_match = dict(scope['headers']).get(b'if-none-match', b'').decode()
+    if etag in [valor.strip().strip('"').removeprefix('W/"') for valor in if_none_match.split(',')]:
+        return await responder(send, 304, cabecalhos=cabecalhos)
+    await responder(send, 200, corpo.encode('utf-8'), cabecalhos=cabecalhos)
+
+
+async def pedidos_lele_data(scope, receive, send):
+    since = inteiro(argumentos(scope).get('since'))
+    # Os novos e o status dos já vistos são consultados ao mesmo tempo
+    respostas = await asyncio.gather(*[executar(c) for c in lele.consultas_cozinha(supabase_async, since)])
+    await responder_json(send, lele.resposta_cozinha(since, *respostas))
+
+
+# Uma só recarga do catálogo por vez neste worker; as outras requisições esperam por ela
+_recarga_catalogo = asyncio.Lock()
+
+
+async def cardapio(scope, receive, send):
+    # Recarrega o catálogo sem bloquear; a página em si é renderizada pelo Flask com o cache já quente
+    if not lele.catalogo_valido():
+        async with _recarga_catalogo:
+            if not lele.catalogo_valido():
+                geracao = lele.geracao_catalogo()
+                response = await executar(lele.consulta_catalogo(supabase_async))
+                # instalar_catalogo usa o lock de threads do lele.py: fora do event loop
+                await asyncio.to_thread(lele.instalar_catalogo, response.data or [], geracao)
+    await flask_app(scope, receive, send)
+
+
+ROTAS = {
+    '/api/mensagens': listar_mensagens,
+    '/api/usuarios_online': usuarios_online,
+    '/pedidos/lele_data': pedidos_lele_data,
+    '/cardapio': cardapio,
+}
+
+
+async def app(scope, receive, send):
+    if scope['type'] == 'lifespan':
+        while True:
+            mensagem = await receive()
+            if mensagem['type'] == 'lifespan.startup':
+                await send({'type': 'lifespan.startup.complete'})
+            elif mensagem['type'] == 'lifespan.shutdown':
+                if hasattr(supabase_async, 'aclose'):
+                    await supabase_async.aclose()
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+    rota = ROTAS.get(scope['path']) if scope['type'] == 'http' and scope['method'] == 'GET' else None
+    if rota is None:
+        return await flask_app(scope, receive, send)
+    try:
+        await rota(scope, receive, send)
+    except Exception as e:
+        logging.error(f"Erro na rota assíncrona {scope['path']}: {str(e)}")
+        await responder_json(send, {"error": "Erro interno do servidor", "detalhe": str(e)}, 500)
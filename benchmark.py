@@ -0,0 +1,358 @@
+"""Teste de carga do Lêle: roda o app Flask de verdade, rota por rota, contra o banco local (dados_local.py).
+
+Gera dados sintéticos (por padrão 100 mil pedidos históricos), dispara as rotas quentes da noite de
+pedidos com várias threads e mostra p50/p95/p99, requisições por segundo e consultas ao banco por requisição.
+
+Uso:
+    python benchmark.py
+    python benchmark.py --pedidos 100000 --threads 8 --requisicoes 500 --cenarios cardapio,lele_data
+    python benchmark.py --json resultado.json   # para comparar uma execução com outra
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+
+CENARIOS = ['login', 'cardapio', 'enviar_pedido', 'lele_data', 'chat', 'pagar_comanda']
+CATEGORIAS = ['ESPETINHOS', 'PÃO COM CHURRAS', 'REFRIS', 'CERVEJAS', 'Bebidas quentes e batidas', 'PORÇÕES']
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Teste de carga das rotas do Lêle com banco SQLite local")
+    parser.add_argument('--pedidos', type=int, default=100000, help="pedidos históricos gerados")
+    parser.add_argument('--clientes', type=int, default=2000, help="clientes cadastrados")
+    parser.add_argument('--itens', type=int, default=80, help="itens do cardápio")
+    parser.add_argument('--abertos', type=int, default=300, help="pedidos em aberto no expediente atual")
+    parser.add_argument('--threads', type=int, default=8, help="requisições simultâneas (threads do gunicorn)")
+    parser.add_argument('--requisicoes', type=int, default=400, help="requisições por cenário")
+    parser.add_argument('--cenarios', default=','.join(CENARIOS), help="cenários separados por vírgula")
+    parser.add_argument('--banco', default=None, help="arquivo SQLite (padrão: temporário, recriado a cada execução)")
+    parser.add_argument('--semente', type=int, default=42, help="semente dos dados sintéticos")
+    parser.add_argument('--json', default=None, help="grava os resultados neste arquivo")
+    parser.add_argument('--fila', action='store_true', help="enviar_pedido pela fila local (FILA_PEDIDOS=1)")
+    return parser.parse_args()
+
+
+def preparar_ambiente(args):
+    """Aponta o app para o banco local antes de importar lele.py"""
+    pasta = tempfile.mkdtemp(prefix='lele_bench_')
+    banco = args.banco or os.path.join(pasta, 'lele.db')
+    if os.path.exists(banco):
+        os.remove(banco)
+    os.environ['LELE_BACKEND'] = 'sqlite'
+    os.environ['LELE_SQLITE'] = banco
+    os.environ['EVENTOS_ARQUIVO'] = os.path.join(pasta, 'eventos.jsonl')
+    if args.fila:
+        os.environ['FILA_PEDIDOS'] = '1'
+        os.environ['FILA_PEDIDOS_ARQUIVO'] = os.path.join(pasta, 'fila.db')
+    os.environ.setdefault('SUPABASE_URL', 'http://localhost')
+    os.environ.setdefault('SUPABASE_KEY', 'local')
+    return banco
+
+
+def produtos_do_pedido(itens):
+    """Produtos no formato gravado por enviar_pedido ("NOME - R$ PRECO", um por unidade), o que
+    montar_vendas lê ao pagar a comanda"""
+    return [f"{item['nome']} - R$ {item['preco']}" for item, quantidade in itens for _ in range(quantidade)]
+
+
+def gerar_dados(banco, args):
+    """Popula itens, clientes, pedidos históricos (pagos), pedidos abertos de hoje e mensagens"""
+    rnd = random.Random(args.semente)
+    agora = datetime.now(timezone.utc)
+
+    itens = [{
+        'ID': f'item{i}',
+        'nome': f'PRODUTO {i}',
+        'descricao': f'Descrição do produto {i}',
+        'preco': round(rnd.uniform(4, 45), 2),
+        'disponivel': rnd.random() > 0.1,
+        'categoria': CATEGORIAS[i % len(CATEGORIAS)],
+        'imagem_url': '/static/produtos/default.png'
+    } for i in range(args.itens)]
+    banco.inserir_em_lote('itens', itens)
+
+    clientes = [{
+        'id_cliente': f'cliente{i}_123456',
+        'nome': f'Cliente {i}',
+        'nome_lower': f'cliente {i}',
+        'senha': '123456',
+        'aniversario': '1990-01-01'
+    } for i in range(args.clientes)]
+    banco.inserir_em_lote('clientes', clientes)
+
+    def pedido(data_hora, status):
+        escolhidos = [(item, rnd.randint(1, 3)) for item in rnd.sample(itens, rnd.randint(1, 4))]
+        cliente = rnd.choice(clientes)
+        return {
+            'mesa': str(rnd.randint(1, 40)),
+            'nome': cliente['nome'],
+            'contato': '11999999999',
+            'produto': produtos_do_pedido(escolhidos),
+            'total': round(sum(item['preco'] * quantidade for item, quantidade in escolhidos), 2),
+            'status': status,
+            'descricao': '',
+            'data_hora': data_hora,
+            'id_cliente': cliente['id_cliente']
+        }
+
+    historico = []
+    for _ in range(args.pedidos):
+        historico.append(pedido(agora - timedelta(days=rnd.randint(1, 365), minutes=rnd.randint(0, 1440)), 'Pago'))
+        if len(historico) == 5000:
+            banco.inserir_em_lote('pedidos_finalizados', historico)
+            historico = []
+    banco.inserir_em_lote('pedidos_finalizados', historico)
+
+    abertos = [pedido(agora - timedelta(minutes=rnd.randint(1, 300)), rnd.choice(['Pedido Realizado', 'Em preparo', 'Entregue']))
+               for _ in range(args.abertos)]
+    abertos.sort(key=lambda p: p['data_hora'])
+    banco.inserir_em_lote('pedidos_finalizados', abertos)
+
+    mensagens = [{
+        'chat_id': 'social',
+        'id_cliente': rnd.choice(clientes)['id_cliente'],
+        'nome': 'Cliente',
+        'mesa': '1',
+        'mensagem': f'mensagem {i}',
+        'created_at': agora - timedelta(minutes=rnd.randint(1, 120))
+    } for i in range(200)]
+    mensagens.sort(key=lambda m: m['created_at'])
+    banco.inserir_em_lote('mensagens', mensagens)
+
+    return itens, clientes
+
+
+def percentil(valores, p):
+    """Percentil pelo método nearest-rank (valores já ordenados)"""
+    if not valores:
+        return 0.0
+    indice = max(0, min(len(valores) - 1, int(round(p / 100 * len(valores) + 0.5)) - 1))
+    return valores[indice]
+
+
+class Cenario:
+    """Um cenário prepara a sessão de cada thread e monta a requisição número n"""
+
+    def __init__(self, nome, sessao, requisicao):
+        self.nome = nome
+        self.sessao = sessao
+        self.requisicao = requisicao
+
+
+def montar_cenarios(itens, clientes, args):
+    disponiveis = [item for item in itens if item['disponivel']]
+    ultimo_pedido = {'numero': 0}
+    pedidos_lock = threading.Lock()
+    # Cada pagar_comanda recebe um cliente diferente; os pedidos a pagar são criados antes da medição
+    a_pagar = [c['id_cliente'] for c in clientes[:args.requisicoes]]
+    # enviar_pedido abre comandas com os outros clientes, para não mexer nas que pagar_comanda vai pagar
+    outros = clientes[args.requisicoes:] or clientes
+
+    def sessao_cliente(cliente, n):
+        with cliente.session_transaction() as s:
+            s['autenticado_cliente'] = True
+            s['id_cliente'] = clientes[n % len(clientes)]['id_cliente']
+
+    def sessao_pedido(cliente, n):
+        with cliente.session_transaction() as s:
+            s['autenticado_cliente'] = True
+            s['id_cliente'] = outros[n % len(outros)]['id_cliente']
+
+    def sessao_funcionario(cliente, n):
+        with cliente.session_transaction() as s:
+            s['autenticado_funcionario'] = True
+            s['autenticado_lele'] = True
+
+    def login(cliente, n):
+        c = clientes[n % len(clientes)]
+        return cliente.post('/login', data={'nome': c['nome'], 'senha': c['senha']})
+
+    def cardapio(cliente, n):
+        return cliente.get(f'/cardapio?mesa={n % 40 + 1}')
+
+    def enviar_pedido(cliente, n):
+        escolhidos = random.sample(disponiveis, 3)
+        return cliente.post('/enviar_pedido', json={
+            'mesa': str(n % 40 + 1),
+            'contato': '11999999999',
+            'observacoes': '',
+            'produto': [{'id': item['ID'], 'quantidade': 1, 'observacao': '', 'sabor': ''} for item in escolhidos],
+            'total': 0
+        })
+
+    def lele_data(cliente, n):
+        # Primeira carga completa a cada 50 requisições, o resto é polling pelo cursor, como o painel faz
+        if n % 50 == 0 or not ultimo_pedido['numero']:
+            resposta = cliente.get('/pedidos/lele_data')
+            dados = resposta.get_json() or []
+            with pedidos_lock:
+                ultimo_pedido['numero'] = max([ultimo_pedido['numero']] + [p['pedido_numero'] for p in dados])
+            return resposta
+        return cliente.get(f"/pedidos/lele_data?since={ultimo_pedido['numero']}")
+
+    def chat(cliente, n):
+        return cliente.get(f'/api/mensagens?chat_id=social&after_id={150 + n % 50}')
+
+    def pagar_comanda(cliente, n):
+        return cliente.post('/caixa/funcionario/pagar_comanda', json={'id_cliente': a_pagar[n % len(a_pagar)]})
+
+    return {
+        'login': Cenario('login', None, login),
+        'cardapio': Cenario('cardapio', sessao_cliente, cardapio),
+        'enviar_pedido': Cenario('enviar_pedido', sessao_pedido, enviar_pedido),
+        'lele_data': Cenario('lele_data', sessao_funcionario, lele_data),
+        'chat': Cenario('chat', sessao_cliente, chat),
+        'pagar_comanda': Cenario('pagar_comanda', sessao_funcionario, pagar_comanda),
+    }, a_pagar
+
+
+def abrir_comandas(banco, ids_clientes, itens):
+    """Dois pedidos em aberto por cliente, para o cenário pagar_comanda"""
+    agora = datetime.now(timezone.utc)
+    escolhidos = [(itens[0], 2), (itens[1], 1)]
+    produtos = produtos_do_pedido(escolhidos)
+    banco.inserir_em_lote('pedidos_finalizados', [{
+        'mesa': '1', 'nome': 'Cliente', 'contato': '', 'status': status, 'descricao': '',
+        'produto': produtos,
+        'total': round(sum(item['preco'] * quantidade for item, quantidade in escolhidos), 2),
+        'data_hora': agora, 'id_cliente': id_cliente
+    } for id_cliente in ids_clientes for status in ('Entregue', 'Em preparo')])
+
+
+def vendas_a_gravar(banco, ids_clientes):
+    """Quantas vendas pagar_comanda deve gravar: uma por produto de cada pedido em aberto desses clientes
+    (os de abrir_comandas e os do gerar_dados). Contado logo antes do cenário, depois dos outros terem rodado"""
+    ids = sorted(set(ids_clientes))
+    linhas = banco.consultar(
+        f"select produto from pedidos_finalizados where status <> 'Pago' and id_cliente in ({', '.join('?' for _ in ids)})", ids)
+    return sum(len(linha['produto'] or []) for linha in linhas)
+
+
+def contar_vendas(banco):
+    """Linhas em vendas e soma das quantidades em vendas_diarias (fora da medição)"""
+    vendas = banco.consultar('select count(*) as n from vendas')[0]['n']
+    consolidado = banco.consultar('select coalesce(sum(quantidade), 0) as n from vendas_diarias')[0]['n']
+    return vendas, consolidado
+
+
+def rodar_cenario(app, banco, cenario, args):
+    """Dispara args.requisicoes requisições com args.threads threads e devolve as métricas"""
+    proxima = {'n': 0}
+    lock = threading.Lock()
+    latencias = []
+    erros = []
+
+    def trabalhador():
+        cliente = app.test_client()
+        while True:
+            with lock:
+                n = proxima['n']
+                if n >= args.requisicoes:
+                    return
+                proxima['n'] += 1
+            if cenario.sessao:
+                cenario.sessao(cliente, n)
+            inicio = time.perf_counter()
+            resposta = cenario.requisicao(cliente, n)
+            duracao = time.perf_counter() - inicio
+            with lock:
+                latencias.append(duracao)
+                if resposta.status_code >= 400:
+                    erros.append(resposta.status_code)
+
+    consultas_antes = banco.total_consultas
+    inicio = time.perf_counter()
+    threads = [threading.Thread(target=trabalhador) for _ in range(args.threads)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    total = time.perf_counter() - inicio
+    consultas = banco.total_consultas - consultas_antes
+
+    latencias.sort()
+    return {
+        'cenario': cenario.nome,
+        'requisicoes': len(latencias),
+        'erros': len(erros),
+        'p50_ms': round(percentil(latencias, 50) * 1000, 2),
+        'p95_ms': round(percentil(latencias, 95) * 1000, 2),
+        'p99_ms': round(percentil(latencias, 99) * 1000, 2),
+        'req_por_s': round(len(latencias) / total, 1) if total else 0.0,
+        'consultas_por_req': round(consultas / len(latencias), 2) if latencias else 0.0
+    }
+
+
+def imprimir(resultados):
+    colunas = ['cenario', 'requisicoes', 'erros', 'p50_ms', 'p95_ms', 'p99_ms', 'req_por_s', 'consultas_por_req']
+    larguras = [max(len(c), *(len(str(r[c])) for r in resultados)) for c in colunas]
+    print('  '.join(c.ljust(w) for c, w in zip(colunas, larguras)))
+    for r in resultados:
+        print('  '.join(str(r[c]).ljust(w) for c, w in zip(colunas, larguras)))
+
+
+def main():
+    args = parse_args()
+    cenarios_pedidos = [c.strip() for c in args.cenarios.split(',') if c.strip()]
+    invalidos = [c for c in cenarios_pedidos if c not in CENARIOS]
+    if invalidos:
+        sys.exit(f"Cenários desconhecidos: {', '.join(invalidos)} (disponíveis: {', '.join(CENARIOS)})")
+
+    preparar_ambiente(args)
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    import logging
+    import lele
+    logging.getLogger().setLevel(logging.WARNING)
+
+    app = lele.app
+    banco = lele.supabase
+    random.seed(args.semente)
+
+    inicio = time.perf_counter()
+    itens, clientes = gerar_dados(banco, args)
+    print(f"Dados gerados em {time.perf_counter() - inicio:.1f}s: {args.pedidos} pedidos históricos, "
+          f"{args.abertos} em aberto, {len(clientes)} clientes, {len(itens)} itens")
+
+    cenarios, a_pagar = montar_cenarios(itens, clientes, args)
+    if 'pagar_comanda' in cenarios_pedidos:
+        abrir_comandas(banco, a_pagar, itens)
+
+    resultados = []
+    for nome in cenarios_pedidos:
+        if nome == 'pagar_comanda':
+            vendas_esperadas = vendas_a_gravar(banco, a_pagar)
+            vendas_antes = contar_vendas(banco)
+        resultados.append(rodar_cenario(app, banco, cenarios[nome], args))
+        if nome == 'pagar_comanda':
+            vendas_depois = contar_vendas(banco)
+            resultados[-1]['vendas_gravadas'] = vendas_depois[0] - vendas_antes[0]
+
+    print()
+    imprimir(resultados)
+
+    # pagar_comanda só mede o insert em lote e o consolidado se as vendas foram de fato gravadas
+    if 'pagar_comanda' in cenarios_pedidos:
+        gravadas = vendas_depois[0] - vendas_antes[0]
+        consolidadas = vendas_depois[1] - vendas_antes[1]
+        print(f"\npagar_comanda: {gravadas} vendas gravadas, {consolidadas} somadas em vendas_diarias (esperado {vendas_esperadas})")
+        if gravadas != vendas_esperadas or consolidadas != vendas_esperadas:
+            sys.exit("pagar_comanda não gravou as vendas esperadas")
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump({
+                'data': datetime.now(timezone.utc).isoformat(),
+                'parametros': vars(args),
+                'resultados': resultados
+            }, f, indent=2, ensure_ascii=False)
+        print(f"\nResultados gravados em {args.json}")
+
+
+if __name__ == '__main__':
+    main()
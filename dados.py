@@ -0,0 +1,206 @@
+"""Acesso a dados do Lêle: cliente Supabase com pool HTTP limitado, keep-alive, timeouts e retentativas,
+ou um banco SQLite local com a mesma interface (dados_local.py) para desenvolvimento e teste de carga."""
+import logging
+import os
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
+
+import httpx
+from postgrest import AsyncPostgrestClient
+from postgrest.constants import DEFAULT_POSTGREST_CLIENT_HEADERS
+from postgrest.utils import SyncClient
+from supabase import create_client, Client
+
+# Threads de requisição por worker do gunicorn (--threads no Dockerfile)
+THREADS_POR_WORKER = int(os.getenv('THREADS_POR_WORKER', 8))
+# Threads (por worker) para consultas independentes feitas ao mesmo tempo; 0 desliga e tudo roda em sequência
+CONSULTAS_PARALELAS = int(os.getenv('CONSULTAS_PARALELAS', 4))
+# Pool de conexões por worker: cabe uma conexão por thread de requisição mais uma por thread de em_paralelo,
+# assim as consultas paralelas nunca esperam (ou estouram SUPABASE_TIMEOUT_POOL) por conexão livre
+SUPABASE_POOL_MAX = int(os.getenv('SUPABASE_POOL_MAX', THREADS_POR_WORKER + CONSULTAS_PARALELAS))
+SUPABASE_KEEPALIVE = float(os.getenv('SUPABASE_KEEPALIVE', 60))
+# Timeouts por chamada (segundos): uma chamada lenta nunca prende uma thread para sempre
+SUPABASE_TIMEOUT = float(os.getenv('SUPABASE_TIMEOUT', 10))
+SUPABASE_TIMEOUT_CONEXAO = float(os.getenv('SUPABASE_TIMEOUT_CONEXAO', 3))
+SUPABASE_TIMEOUT_POOL = float(os.getenv('SUPABASE_TIMEOUT_POOL', 5))
+# Retentativas com backoff exponencial, só para leituras (GET/HEAD)
+SUPABASE_TENTATIVAS = int(os.getenv('SUPABASE_TENTATIVAS', 3))
+SUPABASE_BACKOFF = float(os.getenv('SUPABASE_BACKOFF', 0.2))
+STATUS_RETENTAVEIS = {502, 503, 504}
+# Pool do cliente assíncrono (modo ASGI): várias consultas por conexão, sem uma thread por requisição
+SUPABASE_POOL_MAX_ASSINCRONO = int(os.getenv('SUPABASE_POOL_MAX_ASSINCRONO', 50))
+# Backend de dados: "supabase" (padrão) ou "sqlite" (arquivo em LELE_SQLITE)
+LELE_BACKEND = os.getenv('LELE_BACKEND', 'supabase').lower()
+LELE_SQLITE = os.getenv('LELE_SQLITE', 'lele_local.db')
+
+_pool_lock = threading.Lock()
+pool_stats = {
+    'requisicoes': 0,
+    'em_uso': 0,
+    'pico': 0,
+    'saturado': 0,  # chamadas que começaram com todas as conexões do pool ocupadas
+    'pool_timeouts': 0,
+    'retentativas': 0,
+    'erros': 0
+}
+
+
+# Rastreio por requisição: cada chamada ao backend feita na thread da requisição atual entra na lista
+# (o gunicorn atende uma requisição por thread). Usado pela instrumentação de lele.py.
+_rastreio = threading.local()
+
+
+def iniciar_rastreio():
+    _rastreio.consultas = []
+
+
+def registrar_consulta(descricao, duracao):
+    """Anota uma chamada ao backend (descrição e duração em segundos) na requisição atual, se houver"""
+    consultas = getattr(_rastreio, 'consultas', None)
+    if consultas is not None:
+        consultas.append((descricao, duracao))
+
+
+def encerrar_rastreio():
+    """Devolve as chamadas anotadas desde iniciar_rastreio() e encerra o rastreio"""
+    consultas = getattr(_rastreio, 'consultas', None) or []
+    _rastreio.consultas = None
+    return consultas
+
+
+# Pool compartilhado para consultas independentes de uma mesma requisição (em_paralelo)
+_pool_paralelo = ThreadPoolExecutor(max_workers=CONSULTAS_PARALELAS, thread_name_prefix='consultas') if CONSULTAS_PARALELAS else None
+
+
+def em_paralelo(*tarefas):
+    """Executa funções independentes ao mesmo tempo e devolve os resultados na mesma ordem.
+
+    A primeira roda na própria thread da requisição e as demais no pool; o tempo total passa a ser o da mais
+    lenta, não a soma. As consultas feitas no pool entram no rastreio da requisição que as disparou.
+    Uma exceção em qualquer tarefa é repassada a quem chamou (depois de todas terminarem).
+    As tarefas não devem chamar em_paralelo de novo: esperariam por um pool que elas mesmas ocupam.
+    """
+    if _pool_paralelo is None or len(tarefas) < 2:
+        return [tarefa() for tarefa in tarefas]
+
+    consultas = getattr(_rastreio, 'consultas', None)
+
+    def rodar(tarefa):
+        _rastreio.consultas = consultas
+        try:
+            return tarefa()
+        finally:
+            _rastreio.consultas = None
+
+    futuros = [_pool_paralelo.submit(rodar, tarefa) for tarefa in tarefas[1:]]
+    try:
+        primeiro = tarefas[0]()
+    finally:
+        wait(futuros)
+    return [primeiro] + [futuro.result() for futuro in futuros]
+
+
+class SessaoSupabase(SyncClient):
+    """Sessão httpx usada pelo PostgREST, com métricas do pool e retentativa de leituras"""
+
+    def request(self, method, url, **kwargs):
+        inicio = time.perf_counter()
+        try:
+            return self._request_com_retentativas(method, url, **kwargs)
+        finally:
+            params = kwargs.get('params')
+            registrar_consulta(f"{method} {url}?{params}" if params else f"{method} {url}", time.perf_counter() - inicio)
+
+    def _request_com_retentativas(self, method, url, **kwargs):
+        idempotente = method.upper() in ('GET', 'HEAD')
+        tentativas = SUPABASE_TENTATIVAS if idempotente else 1
+
+        for tentativa in range(1, tentativas + 1):
+            with _pool_lock:
+                pool_stats['requisicoes'] += 1
+                if pool_stats['em_uso'] >= SUPABASE_POOL_MAX:
+                    pool_stats['saturado'] += 1
+                pool_stats['em_uso'] += 1
+                pool_stats['pico'] = max(pool_stats['pico'], pool_stats['em_uso'])
+            try:
+                resposta = super().request(method, url, **kwargs)
+                if resposta.status_code not in STATUS_RETENTAVEIS or tentativa == tentativas:
+                    return resposta
+                logging.warning(f"Supabase respondeu {resposta.status_code} em {method} {url}, tentativa {tentativa}")
+            except httpx.PoolTimeout:
+                with _pool_lock:
+                    pool_stats['pool_timeouts'] += 1
+                    pool_stats['erros'] += 1
+                raise
+            except httpx.TransportError as e:
+                if tentativa == tentativas:
+                    with _pool_lock:
+                        pool_stats['erros'] += 1
+                    raise
+                logging.warning(f"Erro de rede no Supabase em {method} {url}, tentativa {tentativa}: {str(e)}")
+            finally:
+                with _pool_lock:
+                    pool_stats['em_uso'] -= 1
+
+            with _pool_lock:
+                pool_stats['retentativas'] += 1
+            time.sleep(SUPABASE_BACKOFF * (2 ** (tentativa - 1)) * (1 + random.random()))
+
+
+def criar_cliente_supabase(url, key) -> Client:
+    """Cria o cliente Supabase trocando a sessão HTTP padrão do PostgREST pela sessão com pool"""
+    cliente = create_client(url, key)
+    padrao = cliente.postgrest.session
+    cliente.postgrest.session = SessaoSupabase(
+        base_url=padrao.base_url,
+        headers=padrao.headers,
+        timeout=httpx.Timeout(SUPABASE_TIMEOUT, connect=SUPABASE_TIMEOUT_CONEXAO, pool=SUPABASE_TIMEOUT_POOL),
+        limits=httpx.Limits(
+            max_connections=SUPABASE_POOL_MAX,
+            max_keepalive_connections=SUPABASE_POOL_MAX,
+            keepalive_expiry=SUPABASE_KEEPALIVE
+        )
+    )
+    padrao.close()
+    return cliente
+
+
+class ClienteAssincrono(AsyncPostgrestClient):
+    """Cliente PostgREST assíncrono (httpx.AsyncClient) do modo ASGI, com pool limitado e os mesmos timeouts"""
+
+    def create_session(self, base_url, headers, timeout):
+        return httpx.AsyncClient(
+            base_url=base_url,
+            headers=headers,
+            timeout=httpx.Timeout(SUPABASE_TIMEOUT, connect=SUPABASE_TIMEOUT_CONEXAO, pool=SUPABASE_TIMEOUT_POOL),
+            limits=httpx.Limits(
+                max_connections=SUPABASE_POOL_MAX_ASSINCRONO,
+                max_keepalive_connections=SUPABASE_POOL_MAX_ASSINCRONO,
+                keepalive_expiry=SUPABASE_KEEPALIVE
+            )
+        )
+
+
+def criar_cliente_assincrono(url, key):
+    """Cria o cliente assíncrono usado pelas rotas de asgi.py (mesma URL e chave do cliente Supabase)"""
+    return ClienteAssincrono(
+        f"{url}/rest/v1",
+        headers={**DEFAULT_POSTGREST_CLIENT_HEADERS, 'apiKey': key, 'Authorization': f"Bearer {key}"}
+    )
+
+
+def criar_cliente(url, key):
+    """Cria o cliente do backend configurado em LELE_BACKEND"""
+    if LELE_BACKEND == 'sqlite':
+        from dados_local import BancoLocal
+        logging.info(f"Usando banco local SQLite em {LELE_SQLITE}")
+        return BancoLocal(LELE_SQLITE)
+    return criar_cliente_supabase(url, key)
+
+
+def status_pool():
+    """Métricas do pool de conexões deste worker"""
+    with _pool_lock:
+        return {**pool_stats, 'max_conexoes': SUPABASE_POOL_MAX, 'threads': THREADS_POR_WORKER, 'consultas_paralelas': CONSULTAS_PARALELAS, 'backend': LELE_BACKEND, 'pid': os.getpid()}
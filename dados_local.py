@@ -0,0 +1,508 @@
+"""Backend local (SQLite) com a mesma interface de consulta do cliente Supabase usada em lele.py.
+
+Serve para rodar, medir e fazer teste de carga do app sem um projeto Supabase:
+LELE_BACKEND=sqlite LELE_SQLITE=/tmp/lele.db gunicorn lele:app
+
+Implementa o subconjunto do PostgREST que o app usa, com a mesma semântica:
+table(...).select/insert/upsert/update/delete, filtros eq, neq, gt, gte, lt, lte, in_, ilike, is_, or_,
+order (várias colunas), limit, e os RPCs de sql/vendas_diarias.sql e sql/relatorio_financeiro.sql.
+Tabelas: itens, clientes, pedidos_finalizados, vendas, mensagens e vendas_diarias.
+"""
+import json
+import re
+import sqlite3
+import threading
+import time
+from datetime import datetime, timezone
+
+from dados import registrar_consulta
+
+ESQUEMA = """
+create table if not exists itens (
+    "ID" text primary key,
+    nome text,
+    descricao text,
+    preco real,
+    disponivel integer default 1,
+    categoria text,
+    imagem_url text
+);
+create table if not exists clientes (
+    id_cliente text primary key,
+    nome text,
+    nome_lower text unique,
+    senha text,
+    aniversario text
+);
+create table if not exists pedidos_finalizados (
+    pedido_numero integer primary key autoincrement,
+    mesa text,
+    nome text,
+    contato text,
+    produto text,
+    total real,
+    status text,
+    descricao text,
+    data_hora text,
+    id_cliente text,
+    desconto real,
+    dividir1 real,
+    dividir2 real,
+    obs2 text,
+    obs3 text,
+    obs4 text,
+    id_provisorio text unique
+);
+create index if not exists pedidos_abertos_idx on pedidos_finalizados (id_cliente, data_hora) where status <> 'Pago';
+create index if not exists pedidos_data_hora_idx on pedidos_finalizados (data_hora, pedido_numero);
+create table if not exists vendas (
+    id integer primary key autoincrement,
+    nome text,
+    categoria text,
+    preco real,
+    data_hora text
+);
+create index if not exists vendas_data_hora_idx on vendas (data_hora);
+create table if not exists mensagens (
+    id integer primary key autoincrement,
+    chat_id text,
+    id_cliente text,
+    nome text,
+    mesa text,
+    mensagem text,
+    created_at text
+);
+create index if not exists mensagens_chat_idx on mensagens (chat_id, created_at);
+create table if not exists vendas_diarias (
+    dia text not null,
+    nome text not null,
+    categoria text not null default 'Não especificada',
+    preco real not null default 0,
+    quantidade integer not null default 0,
+    valor_total real not null default 0,
+    primary key (dia, nome, categoria)
+);
+"""
+
+# Colunas que no Postgres são timestamptz / jsonb / boolean
+COLUNAS_DATA = {'data_hora', 'created_at'}
+COLUNAS_JSON = {'produto'}
+COLUNAS_BOOL = {'disponivel'}
+# Valor padrão que o Postgres preenche no insert
+PADROES_INSERT = {'mensagens': {'created_at': lambda: datetime.now(timezone.utc)}}
+
+# Linhas por comando insert (o SQLite limita o número de parâmetros por comando)
+LINHAS_POR_INSERT = 200
+
+OPERADORES = {'eq': '=', 'neq': '<>', 'gt': '>', 'gte': '>=', 'lt': '<', 'lte': '<='}
+
+
+class ErroBancoLocal(Exception):
+    """Erro do banco local; code repete o código do PostgREST quando há um equivalente"""
+
+    def __init__(self, mensagem, code=None):
+        super().__init__(mensagem)
+        self.code = code
+
+
+class Resultado:
+    """Mesmo formato do APIResponse do postgrest (data, count)"""
+
+    def __init__(self, data, count=None):
+        self.data = data
+        self.count = count
+        self.text = json.dumps(data, default=str)
+
+
+def normalizar_data(valor):
+    """Converte um timestamp para ISO 8601 em UTC com largura fixa (comparável como texto).
+    Sem fuso, assume UTC, como o Postgres do Supabase."""
+    if isinstance(valor, datetime):
+        dt = valor
+    else:
+        texto = str(valor).strip().replace(' ', 'T', 1).replace('Z', '+00:00')
+        dt = datetime.fromisoformat(texto)
+    if dt.tzinfo is None:
+        dt = dt.replace(tzinfo=timezone.utc)
+    return dt.astimezone(timezone.utc).strftime('%Y-%m-%dT%H:%M:%S.%f+00:00')
+
+
+def para_banco(coluna, valor):
+    if valor is None:
+        return None
+    if coluna in COLUNAS_DATA:
+        return normalizar_data(valor)
+    if coluna in COLUNAS_JSON:
+        return json.dumps(valor, ensure_ascii=False)
+    if coluna in COLUNAS_BOOL:
+        if isinstance(valor, str):
+            return 1 if valor.lower() == 'true' else 0
+        return 1 if valor else 0
+    return valor
+
+
+def do_banco(linha):
+    registro = dict(linha)
+    for coluna, valor in registro.items():
+        if valor is None:
+            continue
+        if coluna in COLUNAS_JSON:
+            try:
+                registro[coluna] = json.loads(valor)
+            except (TypeError, ValueError):
+                pass
+        elif coluna in COLUNAS_BOOL:
+            registro[coluna] = bool(valor)
+    return registro
+
+
+def coluna_sql(coluna):
+    if not re.fullmatch(r'[A-Za-z_][A-Za-z0-9_]*', coluna):
+        raise ErroBancoLocal(f"Coluna inválida: {coluna}")
+    return f'"{coluna}"'
+
+
+def dividir_logico(texto):
+    """Divide "a.eq.1,and(b.lt.2,c.gt.3)" nas vírgulas do nível de cima, respeitando parênteses e aspas"""
+    partes, atual, nivel, aspas = [], '', 0, False
+    for c in texto:
+        if c == '"':
+            aspas = not aspas
+        elif not aspas and c == '(':
+            nivel += 1
+        elif not aspas and c == ')':
+            nivel -= 1
+        elif not aspas and nivel == 0 and c == ',':
+            partes.append(atual)
+            atual = ''
+            continue
+        atual += c
+    if atual:
+        partes.append(atual)
+    return partes
+
+
+def condicao_logica(expressao):
+    """Traduz um filtro lógico do PostgREST (sintaxe de or=(...)) para SQL"""
+    expressao = expressao.strip()
+    m = re.fullmatch(r'(and|or)\((.*)\)', expressao, re.S)
+    if m:
+        partes = [condicao_logica(p) for p in dividir_logico(m.group(2))]
+        sql = f" {m.group(1)} ".join(f"({p[0]})" for p in partes)
+        return sql, [v for p in partes for v in p[1]]
+
+    coluna, operador, valor = expressao.split('.', 2)
+    if valor.startswith('"') and valor.endswith('"'):
+        valor = valor[1:-1]
+    if operador == 'in':
+        valores = [v.strip().strip('"') for v in valor.strip('()').split(',')]
+        return condicao_in(coluna, valores)
+    if operador == 'is':
+        return condicao_is(coluna, valor)
+    if operador in ('like', 'ilike'):
+        return condicao_like(coluna, valor.replace('*', '%'), operador == 'ilike')
+    if operador not in OPERADORES:
+        raise ErroBancoLocal(f"Operador não suportado: {operador}")
+    return f"{coluna_sql(coluna)} {OPERADORES[operador]} ?", [para_banco(coluna, valor)]
+
+
+def condicao_in(coluna, valores):
+    valores = list(valores)
+    if not valores:
+        return "0", []
+    marcadores = ', '.join('?' for _ in valores)
+    return f"{coluna_sql(coluna)} in ({marcadores})", [para_banco(coluna, v) for v in valores]
+
+
+def condicao_is(coluna, valor):
+    valor = str(valor).lower()
+    if valor in ('null', 'none'):
+        return f"{coluna_sql(coluna)} is null", []
+    return f"{coluna_sql(coluna)} is ?", [1 if valor == 'true' else 0]
+
+
+def condicao_like(coluna, padrao, sem_caixa):
+    if sem_caixa:
+        return f"lower({coluna_sql(coluna)}) like lower(?)", [padrao]
+    return f"{coluna_sql(coluna)} like ?", [padrao]
+
+
+class ConsultaLocal:
+    """Equivalente local do SyncRequestBuilder/SyncFilterRequestBuilder do postgrest"""
+
+    def __init__(self, banco, tabela):
+        self.banco = banco
+        self.tabela = tabela
+        self.operacao = 'select'
+        self.colunas = '*'
+        self.dados = None
+        self.filtros = []
+        self.ordenacao = []
+        self.limite = None
+
+    # --- operações ---
+    def select(self, *colunas, count=None):
+        self.operacao = 'select'
+        nomes = [c.strip() for texto in colunas for c in texto.split(',') if c.strip()]
+        self.colunas = '*' if not nomes or '*' in nomes else ', '.join(coluna_sql(c) for c in nomes)
+        return self
+
+    def insert(self, dados, **kwargs):
+        self.operacao = 'insert'
+        self.dados = dados if isinstance(dados, list) else [dados]
+        return self
+
+    def upsert(self, dados, on_conflict='', ignore_duplicates=False, **kwargs):
+        self.operacao = 'upsert'
+        self.dados = dados if isinstance(dados, list) else [dados]
+        self.conflito = on_conflict
+        self.ignorar_duplicados = ignore_duplicates
+        return self
+
+    def update(self, dados, **kwargs):
+        self.operacao = 'update'
+        self.dados = dados
+        return self
+
+    def delete(self, **kwargs):
+        self.operacao = 'delete'
+        return self
+
+    # --- filtros ---
+    def _filtro(self, sql, params):
+        self.filtros.append((sql, params))
+        return self
+
+    def eq(self, coluna, valor):
+        return self._filtro(f"{coluna_sql(coluna)} = ?", [para_banco(coluna, valor)])
+
+    def neq(self, coluna, valor):
+        return self._filtro(f"{coluna_sql(coluna)} <> ?", [para_banco(coluna, valor)])
+
+    def gt(self, coluna, valor):
+        return self._filtro(f"{coluna_sql(coluna)} > ?", [para_banco(coluna, valor)])
+
+    def gte(self, coluna, valor):
+        return self._filtro(f"{coluna_sql(coluna)} >= ?", [para_banco(coluna, valor)])
+
+    def lt(self, coluna, valor):
+        return self._filtro(f"{coluna_sql(coluna)} < ?", [para_banco(coluna, valor)])
+
+    def lte(self, coluna, valor):
+        return self._filtro(f"{coluna_sql(coluna)} <= ?", [para_banco(coluna, valor)])
+
+    def in_(self, coluna, valores):
+        return self._filtro(*condicao_in(coluna, valores))
+
+    def is_(self, coluna, valor):
+        return self._filtro(*condicao_is(coluna, valor))
+
+    def like(self, coluna, padrao):
+        return self._filtro(*condicao_like(coluna, padrao, False))
+
+    def ilike(self, coluna, padrao):
+        return self._filtro(*condicao_like(coluna, padrao, True))
+
+    def or_(self, filtros):
+        partes = [condicao_logica(p) for p in dividir_logico(filtros)]
+        sql = ' or '.join(f"({p[0]})" for p in partes)
+        return self._filtro(sql, [v for p in partes for v in p[1]])
+
+    # --- modificadores ---
+    def order(self, coluna, desc=False, nullsfirst=False):
+        self.ordenacao.append(f"{coluna_sql(coluna)} {'desc' if desc else 'asc'}")
+        return self
+
+    def limit(self, quantidade):
+        self.limite = int(quantidade)
+        return self
+
+    # --- execução ---
+    def _where(self):
+        if not self.filtros:
+            return '', []
+        return ' where ' + ' and '.join(f"({sql})" for sql, _ in self.filtros), [v for _, params in self.filtros for v in params]
+
+    def execute(self):
+        where, params = self._where()
+        tabela = coluna_sql(self.tabela)
+
+        if self.operacao == 'select':
+            sql = f"select {self.colunas} from {tabela}{where}"
+            if self.ordenacao:
+                sql += ' order by ' + ', '.join(self.ordenacao)
+            if self.limite is not None:
+                sql += f" limit {self.limite}"
+            return Resultado(self.banco.consultar(sql, params))
+
+        if self.operacao in ('insert', 'upsert'):
+            # Como no PostgREST, o lote inteiro é um único comando: um insert de várias linhas por conjunto de
+            # colunas, todos na mesma transação
+            grupos = {}
+            for registro in self.dados:
+                registro = dict(registro)
+                for coluna, padrao in PADROES_INSERT.get(self.tabela, {}).items():
+                    registro.setdefault(coluna, padrao())
+                grupos.setdefault(tuple(registro), []).append(registro)
+
+            comandos = []
+            for colunas, registros in grupos.items():
+                sufixo = ''
+                if self.operacao == 'upsert':
+                    alvo = f" ({', '.join(coluna_sql(c.strip()) for c in self.conflito.split(','))})" if self.conflito else ''
+                    if self.ignorar_duplicados:
+                        sufixo = f" on conflict{alvo} do nothing"
+                    else:
+                        sufixo = f" on conflict{alvo} do update set " + ', '.join(f"{coluna_sql(c)} = excluded.{coluna_sql(c)}" for c in colunas)
+                marcadores = '(' + ', '.join('?' for _ in colunas) + ')'
+                for inicio in range(0, len(registros), LINHAS_POR_INSERT):
+                    parte = registros[inicio:inicio + LINHAS_POR_INSERT]
+                    sql = (f"insert into {tabela} ({', '.join(coluna_sql(c) for c in colunas)}) "
+                           f"values {', '.join([marcadores] * len(parte))}{sufixo} returning *")
+                    comandos.append((sql, [para_banco(c, r[c]) for r in parte for c in colunas]))
+            return Resultado(self.banco.transacao(f"{self.operacao} {self.tabela} ({len(self.dados)} linhas)", comandos))
+
+        if self.operacao == 'update':
+            atribuicoes = ', '.join(f"{coluna_sql(c)} = ?" for c in self.dados)
+            valores = [para_banco(c, v) for c, v in self.dados.items()]
+            sql = f"update {tabela} set {atribuicoes}{where} returning *"
+            return Resultado(self.banco.consultar(sql, valores + params))
+
+        if self.operacao == 'delete':
+            return Resultado(self.banco.consultar(f"delete from {tabela}{where} returning *", params))
+
+        raise ErroBancoLocal(f"Operação não suportada: {self.operacao}")
+
+
+class ChamadaRPC:
+    """Equivalente local de supabase.rpc(...) para as funções de sql/vendas_diarias.sql e sql/relatorio_financeiro.sql"""
+
+    def __init__(self, banco, funcao, params):
+        self.banco = banco
+        self.funcao = funcao
+        self.params = params or {}
+
+    def execute(self):
+        if self.funcao == 'registrar_vendas':
+            # vendas e vendas_diarias na mesma transação, como a função do Postgres
+            vendas = [{c: venda.get(c) for c in ('nome', 'categoria', 'preco', 'data_hora')} for venda in self.params.get('linhas', [])]
+            if not vendas:
+                return Resultado([])
+            comandos = []
+            for inicio in range(0, len(vendas), LINHAS_POR_INSERT):
+                parte = vendas[inicio:inicio + LINHAS_POR_INSERT]
+                comandos.append((
+                    f"insert into vendas (nome, categoria, preco, data_hora) values {', '.join(['(?, ?, ?, ?)'] * len(parte))} returning *",
+                    [para_banco(c, v) for venda in parte for c, v in venda.items()]
+                ))
+            return Resultado(self.banco.transacao('rpc registrar_vendas', comandos + [
+                # Soma só as linhas que acabaram de entrar (a transação segura a escrita, então os ids são
+                # contíguos). São Paulo é UTC-3 o ano todo; data_hora fica gravada em UTC
+                ("""insert into vendas_diarias (dia, nome, categoria, preco, quantidade, valor_total)
+                    select date(data_hora, '-3 hours'), nome, coalesce(categoria, 'Não especificada'),
+                           max(preco), count(*), sum(preco)
+                    from vendas where id > (select max(id) from vendas) - ?
+                    group by 1, 2, 3
+                    on conflict (dia, nome, categoria) do update
+                    set preco = excluded.preco,
+                        quantidade = vendas_diarias.quantidade + excluded.quantidade,
+                        valor_total = vendas_diarias.valor_total + excluded.valor_total""",
+                 [len(vendas)])
+            ]))
+
+        if self.funcao == 'relatorio_vendas':
+            p = self.params
+            return Resultado(self.banco.consultar(
+                """select nome, min(categoria) as categoria, max(preco) as preco,
+                          sum(quantidade) as quantidade, sum(valor_total) as valor_total
+                   from vendas_diarias
+                   where (? is null or dia >= ?)
+                     and (? is null or dia <= ?)
+                     and (? is null or lower(nome) like lower('%' || ? || '%'))
+                     and (? is null or categoria = ?)
+                   group by nome
+                   order by sum(valor_total) desc""",
+                [p.get('data_inicio'), p.get('data_inicio'), p.get('data_fim'), p.get('data_fim'),
+                 p.get('nome_busca'), p.get('nome_busca'), p.get('categoria_busca'), p.get('categoria_busca')]
+            ))
+
+        if self.funcao == 'totais_pedidos':
+            p = self.params
+            inicio = para_banco('data_hora', p.get('data_inicio'))
+            fim = para_banco('data_hora', p.get('data_fim'))
+            return Resultado(self.banco.consultar(
+                """select coalesce(sum(total), 0) as total_vendido, count(*) as total_pedidos,
+                          count(case when status = 'Pago' then 1 end) as pedidos_pagos
+                   from pedidos_finalizados
+                   where (? is null or status = ?)
+                     and (? is null or lower(nome) like lower('%' || ? || '%'))
+                     and (? is null or data_hora >= ?)
+                     and (? is null or data_hora <= ?)""",
+                [p.get('status_busca'), p.get('status_busca'), p.get('nome_busca'), p.get('nome_busca'),
+                 inicio, inicio, fim, fim]
+            ))
+
+        raise ErroBancoLocal(f"Função não encontrada: {self.funcao}", code='PGRST202')
+
+
+class BancoLocal:
+    """Banco SQLite com a interface do cliente Supabase (table, from_, rpc)"""
+
+    def __init__(self, caminho=':memory:'):
+        self.caminho = caminho
+        self._lock = threading.Lock()
+        self.total_consultas = 0  # comandos SQL executados (o equivalente às chamadas HTTP ao Supabase)
+        self._conexao = sqlite3.connect(caminho, check_same_thread=False, isolation_level=None)
+        self._conexao.row_factory = sqlite3.Row
+        if caminho != ':memory:':
+            self._conexao.execute('pragma journal_mode=wal')
+            self._conexao.execute('pragma busy_timeout=5000')
+        self._conexao.executescript(ESQUEMA)
+
+    def consultar(self, sql, params=()):
+        inicio = time.perf_counter()
+        with self._lock:
+            self.total_consultas += 1
+            cursor = self._conexao.execute(sql, list(params))
+            linhas = [do_banco(linha) for linha in cursor.fetchall()]
+        registrar_consulta(' '.join(sql.split()), time.perf_counter() - inicio)
+        return linhas
+
+    def transacao(self, descricao, comandos):
+        """Executa [(sql, params), ...] numa única transação e devolve as linhas retornadas. Conta como uma
+        chamada só: é o que um execute() custa no Supabase, uma requisição HTTP, mesmo gravando várias linhas."""
+        inicio = time.perf_counter()
+        linhas = []
+        with self._lock:
+            self.total_consultas += 1
+            self._conexao.execute('begin')
+            try:
+                for sql, params in comandos:
+                    linhas.extend(do_banco(linha) for linha in self._conexao.execute(sql, params).fetchall())
+                self._conexao.execute('commit')
+            except Exception:
+                self._conexao.execute('rollback')
+                raise
+        registrar_consulta(descricao, time.perf_counter() - inicio)
+        return linhas
+
+    def inserir_em_lote(self, tabela, registros):
+        """Carga rápida de dados sintéticos (sem returning)"""
+        registros = list(registros)
+        if not registros:
+            return
+        colunas = list(registros[0])
+        sql = f"insert into {coluna_sql(tabela)} ({', '.join(coluna_sql(c) for c in colunas)}) values ({', '.join('?' for _ in colunas)})"
+        with self._lock:
+            self._conexao.execute('begin')
+            self._conexao.executemany(sql, [[para_banco(c, r.get(c)) for c in colunas] for r in registros])
+            self._conexao.execute('commit')
+
+    def table(self, tabela):
+        return ConsultaLocal(self, tabela)
+
+    def from_(self, tabela):
+        return self.table(tabela)
+
+    def rpc(self, funcao, params):
+        return ChamadaRPC(self, funcao, params)
@@ -0,0 +1,160 @@
+"""Arquivos estáticos do Lêle: nome com impressão digital, cache imutável, ETag e versões pré-comprimidas.
+
+url_for('static', filename='style.css') passa a gerar /static/style.<hash>.css. Esse endereço muda quando o
+arquivo muda, então pode ficar em cache no navegador por um ano (Cache-Control immutable). Endereços sem
+hash (ou com um hash antigo) continuam funcionando, com revalidação por ETag (304).
+CSS/JS/SVG são servidos em gzip ou brotli, comprimidos uma vez por versão e guardados em disco.
+"""
+import gzip
+import hashlib
+import mimetypes
+import os
+import re
+import tempfile
+import threading
+
+from flask import request, send_file, url_for, abort
+from werkzeug.security import safe_join
+
+try:
+    import brotli
+except ImportError:  # sem brotli, só gzip
+    brotli = None
+
+PASTA_ESTATICOS = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'static')
+PASTA_COMPRIMIDOS = os.getenv('ESTATICOS_COMPRIMIDOS', os.path.join(tempfile.gettempdir(), 'lele_estaticos'))
+CACHE_IMUTAVEL = 'public, max-age=31536000, immutable'
+CACHE_REVALIDAR = 'public, no-cache'
+EXTENSOES_COMPRIMIVEIS = {'.css', '.js', '.svg', '.json', '.txt', '.html'}
+PADRAO_DIGITAL = re.compile(r'^(?P<base>.+)\.(?P<digital>[0-9a-f]{12})(?P<ext>\.[A-Za-z0-9]+)$')
+
+_lock = threading.Lock()
+_digitais = {}  # caminho -> (mtime, tamanho, digital)
+_urls = {}  # (arquivo, digital) -> endereço com hash, para os templates que repetem a mesma imagem
+
+
+def caminho_estatico(filename):
+    caminho = safe_join(PASTA_ESTATICOS, filename)
+    return caminho if caminho and os.path.isfile(caminho) else None
+
+
+def digital(filename):
+    """Hash do conteúdo do arquivo (12 caracteres), recalculado só quando o arquivo muda"""
+    caminho = caminho_estatico(filename)
+    if not caminho:
+        return None
+    info = os.stat(caminho)
+    with _lock:
+        guardado = _digitais.get(caminho)
+        if guardado and guardado[0] == info.st_mtime and guardado[1] == info.st_size:
+            return guardado[2]
+    h = hashlib.md5()
+    with open(caminho, 'rb') as f:
+        for bloco in iter(lambda: f.read(1 << 16), b''):
+            h.update(bloco)
+    valor = h.hexdigest()[:12]
+    with _lock:
+        _digitais[caminho] = (info.st_mtime, info.st_size, valor)
+    return valor
+
+
+def nome_com_digital(filename):
+    """style.css -> style.<hash>.css (o nome fica igual se o arquivo não existir)"""
+    valor = digital(filename)
+    if not valor:
+        return filename
+    base, ext = os.path.splitext(filename)
+    return f"{base}.{valor}{ext}"
+
+
+def url_estatico(url):
+    """Filtro de template: troca um caminho /static/... (ex.: itens.imagem_url) pelo endereço com hash"""
+    if url and url.startswith(('/static/', 'static/')):
+        filename = url.split('static/', 1)[1]
+        chave = (filename, digital(filename))
+        valor = _urls.get(chave)
+        if valor is None:
+            valor = _urls[chave] = url_for('static', filename=filename)
+        return valor
+    return url
+
+
+def versao_comprimida(caminho, valor, codificacao):
+    """Caminho da versão comprimida do arquivo, gerada na primeira vez que é pedida"""
+    relativo = os.path.relpath(caminho, PASTA_ESTATICOS)
+    destino = os.path.join(PASTA_COMPRIMIDOS, valor, f"{relativo}.{codificacao}")
+    if os.path.isfile(destino):
+        return destino
+    with open(caminho, 'rb') as f:
+        conteudo = f.read()
+    if codificacao == 'br':
+        comprimido = brotli.compress(conteudo, quality=11)
+    else:
+        comprimido = gzip.compress(conteudo, compresslevel=9, mtime=0)
+    os.makedirs(os.path.dirname(destino), exist_ok=True)
+    # Grava num temporário e renomeia: outro worker nunca lê um arquivo pela metade
+    fd, temporario = tempfile.mkstemp(dir=os.path.dirname(destino))
+    with os.fdopen(fd, 'wb') as f:
+        f.write(comprimido)
+    os.replace(temporario, destino)
+    return destino
+
+
+def escolher_codificacao(filename):
+    if os.path.splitext(filename)[1].lower() not in EXTENSOES_COMPRIMIVEIS:
+        return None
+    aceitas = request.accept_encodings
+    if brotli and aceitas['br']:
+        return 'br'
+    if aceitas['gzip']:
+        return 'gzip'
+    return None
+
+
+def servir_estatico(filename):
+    """Substitui a view static padrão do Flask"""
+    imutavel = False
+    if not caminho_estatico(filename):
+        m = PADRAO_DIGITAL.match(filename)
+        if not m or not caminho_estatico(m['base'] + m['ext']):
+            abort(404)
+        filename = m['base'] + m['ext']
+        imutavel = m['digital'] == digital(filename)
+
+    caminho = caminho_estatico(filename)
+    valor = digital(filename)
+    mimetype = mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+    codificacao = escolher_codificacao(filename)
+
+    if codificacao:
+        response = send_file(versao_comprimida(caminho, valor, codificacao), mimetype=mimetype,
+                             etag=f"{valor}-{codificacao}", conditional=True)
+        response.headers['Content-Encoding'] = codificacao
+    else:
+        response = send_file(caminho, mimetype=mimetype, etag=valor, conditional=True)
+    if os.path.splitext(filename)[1].lower() in EXTENSOES_COMPRIMIVEIS:
+        response.vary.add('Accept-Encoding')
+    response.headers['Cache-Control'] = CACHE_IMUTAVEL if imutavel else CACHE_REVALIDAR
+    return response
+
+
+def registrar_estaticos(app):
+    """Liga o hash no url_for('static'), a view de estáticos e o filtro |estatico nos templates"""
+    app.view_functions['static'] = servir_estatico
+    app.add_template_filter(url_estatico, 'estatico')
+
+    @app.url_defaults
+    def adicionar_digital(endpoint, values):
+        if endpoint == 'static' and 'filename' in values:
+            values['filename'] = nome_com_digital(values['filename'])
+
+
+if __name__ == '__main__':
+    # Pré-comprime tudo (ex.: no build da imagem), para a primeira requisição não pagar a compressão
+    codificacoes = ['gzip'] + (['br'] if brotli else [])
+    for raiz, _, arquivos in os.walk(PASTA_ESTATICOS):
+        for nome in arquivos:
+            if os.path.splitext(nome)[1].lower() in EXTENSOES_COMPRIMIVEIS:
+                relativo = os.path.relpath(os.path.join(raiz, nome), PASTA_ESTATICOS)
+                for codificacao in codificacoes:
+                    print(versao_comprimida(os.path.join(raiz, nome), digital(relativo), codificacao))
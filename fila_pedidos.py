@@ -0,0 +1,211 @@
+"""Fila local (write-behind) dos pedidos novos.
+
+enviar_pedido valida o pedido, grava no diário local (SQLite em disco, com synchronous=full) e responde na
+hora com um número provisório. Uma thread por worker descarrega o diário em lotes para pedidos_finalizados,
+com retentativa e backoff exponencial; se o Supabase cair, os pedidos esperam no diário em vez de se perder
+ou de prender as threads do gunicorn.
+
+A gravação é idempotente: cada pedido leva o número provisório na coluna id_provisorio (única, ver
+sql/fila_pedidos.sql) e o lote é enviado como upsert ignorando duplicados. Um lote que chegou ao banco mas
+cuja resposta se perdeu pode ser reenviado sem duplicar pedidos.
+Vários workers podem ler o mesmo diário: cada um reserva o lote que vai enviar.
+"""
+import json
+import logging
+import os
+import secrets
+import sqlite3
+import threading
+import time
+
+import httpx
+
+# Sem padrão de propósito: o diário precisa ficar num disco que sobreviva à instância (no Cloud Run o
+# diretório temporário fica em memória e some quando a instância é reciclada, levando os pedidos pendentes)
+FILA_ARQUIVO = os.getenv('FILA_PEDIDOS_ARQUIVO')
+FILA_LOTE = int(os.getenv('FILA_PEDIDOS_LOTE', 50))
+FILA_INTERVALO = float(os.getenv('FILA_PEDIDOS_INTERVALO', 1))
+FILA_BACKOFF = float(os.getenv('FILA_PEDIDOS_BACKOFF', 0.5))
+FILA_BACKOFF_MAX = float(os.getenv('FILA_PEDIDOS_BACKOFF_MAX', 60))
+FILA_RESERVA = 60  # segundos que um lote fica reservado para o worker que o pegou
+FILA_GUARDAR = 24 * 3600  # pedidos já gravados ficam no diário por um dia (números provisórios -> definitivos)
+
+ESQUEMA = """
+create table if not exists fila (
+    id integer primary key autoincrement,
+    provisorio text not null unique,
+    id_cliente text,
+    pedido text not null,
+    criado_em real not null,
+    tentativas integer not null default 0,
+    proxima_tentativa real not null default 0,
+    reservado_ate real not null default 0,
+    erro text,
+    pedido_numero integer,
+    gravado_em real
+);
+create index if not exists fila_pendentes_idx on fila (gravado_em, proxima_tentativa);
+"""
+
+
+def novo_provisorio():
+    """Número provisório mostrado ao cliente até o pedido chegar ao banco (ex.: P-3F9A1C)"""
+    return f"P-{secrets.token_hex(3).upper()}"
+
+
+class FilaPedidos:
+    """Diário local de pedidos com uma thread que descarrega em lotes.
+
+    gravar(pedidos) grava a lista no banco e devolve as linhas inseridas (com pedido_numero e id_provisorio);
+    ao_gravar(linha) é chamado para cada linha inserida (eventos do painel, por exemplo).
+    """
+
+    def __init__(self, caminho, gravar, ao_gravar=None):
+        self.caminho = caminho
+        self.gravar = gravar
+        self.ao_gravar = ao_gravar
+        self._lock = threading.Lock()
+        self._acordar = threading.Event()
+        self._parar = threading.Event()
+        self._thread = None
+        self.stats = {'enfileirados': 0, 'gravados': 0, 'lotes': 0, 'falhas': 0, 'ultima_falha': None}
+        self._conexao = sqlite3.connect(caminho, check_same_thread=False, isolation_level=None, timeout=10)
+        self._conexao.row_factory = sqlite3.Row
+        self._conexao.execute('pragma journal_mode=wal')
+        self._conexao.execute('pragma synchronous=full')
+        self._conexao.executescript(ESQUEMA)
+
+    def enfileirar(self, pedido):
+        """Grava o pedido no diário e devolve o número provisório"""
+        provisorio = novo_provisorio()
+        with self._lock:
+            self._conexao.execute(
+                "insert into fila (provisorio, id_cliente, pedido, criado_em) values (?, ?, ?, ?)",
+                (provisorio, pedido.get('id_cliente'), json.dumps({**pedido, 'id_provisorio': provisorio}, ensure_ascii=False), time.time())
+            )
+            self.stats['enfileirados'] += 1
+        self._acordar.set()
+        return provisorio
+
+    def pendentes(self, id_cliente=None):
+        """Pedidos ainda não gravados no banco (de um cliente, se informado)"""
+        sql = "select provisorio, pedido, tentativas, erro from fila where gravado_em is null"
+        params = []
+        if id_cliente:
+            sql += " and id_cliente = ?"
+            params.append(id_cliente)
+        with self._lock:
+            linhas = self._conexao.execute(sql + " order by id", params).fetchall()
+        return [{**json.loads(linha['pedido']), 'tentativas': linha['tentativas'], 'erro': linha['erro']} for linha in linhas]
+
+    def _reservar(self):
+        agora = time.time()
+        with self._lock:
+            self._conexao.execute('begin immediate')
+            try:
+                linhas = self._conexao.execute(
+                    """update fila set reservado_ate = ?
+                       where id in (select id from fila
+                                    where gravado_em is null and proxima_tentativa <= ? and reservado_ate <= ?
+                                    order by id limit ?)
+                       returning id, provisorio, pedido, tentativas""",
+                    (agora + FILA_RESERVA, agora, agora, FILA_LOTE)
+                ).fetchall()
+                self._conexao.execute('commit')
+            except Exception:
+                self._conexao.execute('rollback')
+                raise
+        return sorted(linhas, key=lambda linha: linha['id'])
+
+    def _marcar_gravados(self, lote, inseridos):
+        numeros = {linha.get('id_provisorio'): linha.get('pedido_numero') for linha in inseridos}
+        agora = time.time()
+        with self._lock:
+            self._conexao.executemany(
+                "update fila set gravado_em = ?, pedido_numero = ?, erro = null, reservado_ate = 0 where id = ?",
+                [(agora, numeros.get(linha['provisorio']), linha['id']) for linha in lote]
+            )
+            self._conexao.execute("delete from fila where gravado_em < ?", (agora - FILA_GUARDAR,))
+            self.stats['gravados'] += len(lote)
+            self.stats['lotes'] += 1
+
+    def _marcar_falha(self, lote, erro):
+        agora = time.time()
+        with self._lock:
+            self._conexao.executemany(
+                "update fila set tentativas = tentativas + 1, proxima_tentativa = ?, reservado_ate = 0, erro = ? where id = ?",
+                [(agora + min(FILA_BACKOFF_MAX, FILA_BACKOFF * 2 ** linha['tentativas']), str(erro)[:500], linha['id']) for linha in lote]
+            )
+            self.stats['falhas'] += 1
+            self.stats['ultima_falha'] = agora
+
+    def _enviar(self, lote):
+        try:
+            inseridos = self.gravar([json.loads(linha['pedido']) for linha in lote]) or []
+        except Exception as e:
+            # Falha de rede: o lote inteiro volta para a fila. Outro erro (um pedido recusado pelo banco,
+            # por exemplo) é isolado: cada pedido do lote é tentado sozinho, para um não travar os outros
+            if len(lote) > 1 and not isinstance(e, httpx.TransportError):
+                for linha in lote:
+                    self._enviar([linha])
+                return
+            logging.warning("Falha ao gravar %d pedido(s) da fila: %s", len(lote), e)
+            self._marcar_falha(lote, e)
+            return
+
+        self._marcar_gravados(lote, inseridos)
+        if self.ao_gravar:
+            for linha in inseridos:
+                try:
+                    self.ao_gravar(linha)
+                except Exception as e:
+                    logging.error(f"Erro ao notificar pedido gravado: {str(e)}")
+
+    def descarregar(self):
+        """Envia um lote do diário para o banco; devolve quantos pedidos foram tentados"""
+        lote = self._reservar()
+        if lote:
+            self._enviar(lote)
+        return len(lote)
+
+    def _loop(self):
+        while not self._parar.is_set():
+            try:
+                while self.descarregar() == FILA_LOTE and not self._parar.is_set():
+                    pass
+            except Exception as e:
+                logging.error(f"Erro na thread da fila de pedidos: {str(e)}")
+            self._acordar.wait(FILA_INTERVALO)
+            self._acordar.clear()
+
+    def iniciar(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._loop, name='fila-pedidos', daemon=True)
+            self._thread.start()
+
+    def parar(self):
+        """Para a thread e tenta uma última descarga (o que sobrar continua no diário)"""
+        self._parar.set()
+        self._acordar.set()
+        if self._thread:
+            self._thread.join(timeout=5)
+        try:
+            self.descarregar()
+        except Exception as e:
+            logging.warning(f"Pedidos continuam na fila ao encerrar: {str(e)}")
+
+    def status(self):
+        with self._lock:
+            linha = self._conexao.execute(
+                "select count(*) as pendentes, sum(tentativas > 0) as com_erro, min(criado_em) as mais_antigo from fila where gravado_em is null"
+            ).fetchone()
+            stats = dict(self.stats)
+        mais_antigo = linha['mais_antigo']
+        return {
+            **stats,
+            'pendentes': linha['pendentes'],
+            'com_erro': linha['com_erro'] or 0,
+            'espera_segundos': round(time.time() - mais_antigo, 1) if mais_antigo else 0,
+            'arquivo': self.caminho,
+            'pid': os.getpid()
+        }
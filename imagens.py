@@ -0,0 +1,162 @@
+"""Miniaturas das imagens do Lêle em WebP/AVIF, geradas sob demanda e guardadas em disco.
+
+/imagem/<largura>/<formato>/<arquivo com hash> devolve a imagem de static/ reduzida para a largura pedida
+(só as de LARGURAS, para o cache não crescer sem limite). Os templates usam os filtros |srcset e |miniatura
+e a função image_set(); sem o Pillow instalado tudo cai de volta para o arquivo original.
+Para gerar tudo de antemão (ex.: no build da imagem): python imagens.py
+"""
+import logging
+import os
+import tempfile
+import threading
+
+from flask import abort, redirect, send_file, url_for
+from markupsafe import Markup
+
+from estaticos import (CACHE_IMUTAVEL, CACHE_REVALIDAR, PADRAO_DIGITAL, PASTA_ESTATICOS, caminho_estatico,
+                       digital, nome_com_digital, url_estatico)
+
+try:
+    from PIL import Image, ImageOps, features
+except ImportError:  # sem Pillow, os templates usam as imagens originais
+    Image = None
+
+PASTA_IMAGENS = os.getenv('IMAGENS_CACHE', os.path.join(tempfile.gettempdir(), 'lele_imagens'))
+# 150/300/450: cards do cardápio (150px em telas 1x, 2x e 3x); 960: tutorial; 1920: papel de parede
+LARGURAS = (150, 300, 450, 960, 1920)
+LARGURAS_CARD = (150, 300, 450)
+QUALIDADE = {'webp': 80, 'avif': 60}
+TIPOS = {'webp': 'image/webp', 'avif': 'image/avif'}
+EXTENSOES_IMAGEM = {'.jpg', '.jpeg', '.png', '.webp'}
+
+FORMATOS = [f for f in ('avif', 'webp') if Image and features.check(f)] if Image else []
+MINIATURAS_ATIVAS = bool(FORMATOS)
+
+_lock = threading.Lock()
+_gerando = {}  # destino -> Lock, para duas threads não reduzirem a mesma imagem ao mesmo tempo
+_srcsets = {}  # (arquivo, hash, formato, larguras) -> srcset pronto
+
+
+def arquivo_estatico(url):
+    """'/static/produtos/x.jpg' -> 'produtos/x.jpg', se for uma imagem que existe em static/"""
+    if not url or not url.startswith(('/static/', 'static/')):
+        return None
+    filename = url.split('static/', 1)[1]
+    if os.path.splitext(filename)[1].lower() not in EXTENSOES_IMAGEM or not caminho_estatico(filename):
+        return None
+    return filename
+
+
+def miniatura(url, largura, formato='webp'):
+    """Filtro de template: endereço da miniatura (ou da imagem original, se não houver miniatura)"""
+    filename = arquivo_estatico(url)
+    if not filename or formato not in FORMATOS or largura not in LARGURAS:
+        return url_estatico(url)
+    return url_for('imagem', largura=largura, formato=formato, filename=nome_com_digital(filename))
+
+
+def srcset(url, formato='webp', larguras=LARGURAS_CARD):
+    """Filtro de template: srcset com as miniaturas no formato pedido ('' se não houver miniatura)"""
+    filename = arquivo_estatico(url)
+    if not filename or formato not in FORMATOS:
+        return ''
+    # O cardápio pede o mesmo srcset para cada card em toda renderização: guarda pelo hash do arquivo
+    chave = (filename, digital(filename), formato, tuple(larguras))
+    valor = _srcsets.get(chave)
+    if valor is None:
+        valor = ', '.join(f"{miniatura(url, largura, formato)} {largura}w" for largura in larguras)
+        _srcsets[chave] = valor
+    return valor
+
+
+def image_set(filename, largura):
+    """Valor CSS image-set() com as versões AVIF/WebP de um fundo e o original como última opção"""
+    original = url_for('static', filename=filename)
+    opcoes = [f'url("{miniatura("/static/" + filename, largura, formato)}") type("{TIPOS[formato]}")' for formato in FORMATOS]
+    if not opcoes:
+        return Markup(f'url("{original}")')
+    tipo_original = 'image/' + os.path.splitext(filename)[1][1:].lower().replace('jpg', 'jpeg')
+    # Markup: o valor vai dentro de <style>, onde as aspas não podem virar entidades HTML
+    return Markup('image-set(' + ', '.join(opcoes + [f'url("{original}") type("{tipo_original}")']) + ')')
+
+
+def gerar_miniatura(filename, valor, largura, formato):
+    """Reduz a imagem para a largura pedida (sem ampliar) e grava no cache; devolve o caminho"""
+    destino = os.path.join(PASTA_IMAGENS, valor, f"{filename}.{largura}.{formato}")
+    if os.path.isfile(destino):
+        return destino
+
+    with _lock:
+        lock = _gerando.setdefault(destino, threading.Lock())
+    with lock:
+        if not os.path.isfile(destino):
+            with Image.open(caminho_estatico(filename)) as imagem:
+                # JPEG grande (alguns produtos têm mais de 10 MB) já é decodificado numa escala menor
+                imagem.draft('RGB', (largura, largura))
+                imagem = ImageOps.exif_transpose(imagem)
+                if imagem.mode not in ('RGB', 'RGBA'):
+                    imagem = imagem.convert('RGBA' if 'transparency' in imagem.info or imagem.mode in ('LA', 'PA') else 'RGB')
+                imagem.thumbnail((largura, largura * 4), Image.LANCZOS)
+                os.makedirs(os.path.dirname(destino), exist_ok=True)
+                fd, temporario = tempfile.mkstemp(dir=os.path.dirname(destino))
+                try:
+                    with os.fdopen(fd, 'wb') as f:
+                        imagem.save(f, format=formato.upper(), quality=QUALIDADE[formato])
+                    os.replace(temporario, destino)
+                except Exception:
+                    os.remove(temporario)
+                    raise
+    with _lock:
+        _gerando.pop(destino, None)
+    return destino
+
+
+def servir_imagem(largura, formato, filename):
+    """Rota /imagem/<largura>/<formato>/<arquivo>: miniatura com cache imutável quando o hash confere"""
+    if not MINIATURAS_ATIVAS or formato not in FORMATOS or largura not in LARGURAS:
+        abort(404)
+    imutavel = False
+    m = PADRAO_DIGITAL.match(filename)
+    if m and caminho_estatico(m['base'] + m['ext']):
+        filename = m['base'] + m['ext']
+        valor = digital(filename)
+        imutavel = m['digital'] == valor
+    elif caminho_estatico(filename):
+        valor = digital(filename)
+    else:
+        abort(404)
+    if os.path.splitext(filename)[1].lower() not in EXTENSOES_IMAGEM:
+        abort(404)
+
+    try:
+        destino = gerar_miniatura(filename, valor, largura, formato)
+    except (OSError, ValueError) as e:
+        logging.warning(f"Não foi possível gerar miniatura de {filename}: {str(e)}")
+        return redirect(url_for('static', filename=filename))
+
+    response = send_file(destino, mimetype=TIPOS[formato], etag=f"{valor}-{largura}-{formato}", conditional=True)
+    response.headers['Cache-Control'] = CACHE_IMUTAVEL if imutavel else CACHE_REVALIDAR
+    return response
+
+
+def registrar_imagens(app):
+    """Liga a rota /imagem/... e os filtros |miniatura, |srcset e image_set() nos templates"""
+    app.add_url_rule('/imagem/<int:largura>/<formato>/<path:filename>', 'imagem', servir_imagem)
+    app.add_template_filter(miniatura, 'miniatura')
+    app.add_template_filter(srcset, 'srcset')
+    app.add_template_global(image_set, 'image_set')
+    app.add_template_global(MINIATURAS_ATIVAS, 'miniaturas_ativas')
+
+
+if __name__ == '__main__':
+    if not MINIATURAS_ATIVAS:
+        raise SystemExit("Pillow com suporte a WebP/AVIF não está instalado")
+    for raiz, _, arquivos in os.walk(PASTA_ESTATICOS):
+        for nome in arquivos:
+            if os.path.splitext(nome)[1].lower() not in EXTENSOES_IMAGEM:
+                continue
+            relativo = os.path.relpath(os.path.join(raiz, nome), PASTA_ESTATICOS)
+            larguras = (1920,) if relativo.startswith('wallpaper') else (960,) if relativo.startswith('tutorial') else LARGURAS_CARD
+            for largura in larguras:
+                for formato in FORMATOS:
+                    print(gerar_miniatura(relativo, digital(relativo), largura, formato))
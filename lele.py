@@ -1,27 +1,353 @@
-from flask import Flask, render_template, request, jsonify, redirect, url_for, session, send_from_directory
-from supabase import create_client, Client
+from flask import Flask, render_template, request, jsonify, redirect, url_for, session, send_from_directory, Response, stream_with_context, g
+from markupsafe import Markup
+from supabase import Client
 import os
 from dotenv import load_dotenv
-from datetime import datetime, timedelta
+from datetime import datetime, timedelta, timezone
 import pytz
 import logging
+from logging.handlers import QueueHandler, QueueListener
+import atexit
+import queue
+import random
+import sys
+from dados import criar_cliente, status_pool, iniciar_rastreio, encerrar_rastreio, em_paralelo
+from estaticos import registrar_estaticos
+from imagens import registrar_imagens, miniatura
+from fila_pedidos import FilaPedidos, FILA_ARQUIVO
 import json
+import hashlib
+import tempfile
+import threading
+import time
+from collections import OrderedDict
 from zoneinfo import ZoneInfo
 
-# Configuração de logging
-logging.basicConfig(level=logging.DEBUG)
+try:
+    import fcntl
+except ImportError:  # Windows (desenvolvimento local)
+    fcntl = None
 
 # Carrega variáveis de ambiente
 load_dotenv()
 
+# Configuração de logging: nível em LOG_LEVEL (padrão INFO; DEBUG só para investigar localmente).
+# Com LOG_ASSINCRONO=1 (padrão) os registros vão para uma fila e uma thread separada formata e
+# escreve no stdout, então a thread da requisição não espera a escrita síncrona do Cloud Run.
+# Logs por item (um por venda, por exemplo) são amostrados com a taxa LOG_AMOSTRA (0 a 1).
+LOG_LEVEL = os.getenv('LOG_LEVEL', 'INFO').upper()
+LOG_ASSINCRONO = os.getenv('LOG_ASSINCRONO', '1') == '1'
+LOG_AMOSTRA = float(os.getenv('LOG_AMOSTRA', 0.01))
+
+
+class FilaLog(QueueHandler):
+    """QueueHandler que deixa a formatação da mensagem para a thread do QueueListener"""
+
+    def prepare(self, record):
+        # A fila é do próprio processo, o registro não precisa ser serializado aqui
+        return record
+
+
+def configurar_logging():
+    saida = logging.StreamHandler(sys.stdout)
+    saida.setFormatter(logging.Formatter('%(levelname)s:%(name)s:%(message)s'))
+    raiz = logging.getLogger()
+    raiz.setLevel(LOG_LEVEL)
+    if not LOG_ASSINCRONO:
+        raiz.handlers = [saida]
+        return
+    fila = queue.SimpleQueue()
+    raiz.handlers = [FilaLog(fila)]
+    ouvinte = QueueListener(fila, saida)
+    ouvinte.start()
+    atexit.register(ouvinte.stop)
+
+
+def log_amostrado(nivel, mensagem, *args):
+    """Registra só uma amostra (LOG_AMOSTRA) das mensagens repetidas por item"""
+    if LOG_AMOSTRA > 0 and logging.getLogger().isEnabledFor(nivel) and random.random() < LOG_AMOSTRA:
+        logging.log(nivel, mensagem, *args)
+
+
+configurar_logging()
+
 # Inicializa o Flask
 app = Flask(__name__)
 app.secret_key = os.getenv('SECRET_KEY', 'churrasquinho_lele_fixed_key_2025')  # Adicione SECRET_KEY no Render env pra segurança
+# Estáticos com hash no nome, cache imutável e CSS/JS pré-comprimidos (estaticos.py)
+registrar_estaticos(app)
+# Miniaturas WebP/AVIF das imagens de produtos, tutorial e fundo (imagens.py)
+registrar_imagens(app)
 
-# Configura o Supabase
+# Configura o Supabase (pool HTTP, timeouts e retentativas em dados.py).
+# Com LELE_BACKEND=sqlite usa um banco local com a mesma interface (dados_local.py).
 SUPABASE_URL = os.getenv("SUPABASE_URL")
 SUPABASE_KEY = os.getenv("SUPABASE_KEY")
-supabase: Client = create_client(SUPABASE_URL, SUPABASE_KEY)
+supabase: Client = criar_cliente(SUPABASE_URL, SUPABASE_KEY)
+
+# Cache do catálogo (tabela itens) em memória, um por worker do gunicorn.
+# Expira após CATALOGO_TTL segundos e é invalidado pelas rotas /estoque/*.
+# A versão é um hash do conteúdo: igual em todos os workers e só muda quando algum item muda.
+CATALOGO_TTL = float(os.getenv('CATALOGO_TTL', 30))
+# _catalogo_lock só protege a troca do cache (nunca é segurado durante I/O);
+# _recarga_lock faz uma só thread por worker ir ao Supabase quando o cache expira
+_catalogo_lock = threading.Lock()
+_recarga_lock = threading.Lock()
+# Cada recarga monta um catálogo novo, que depois não muda mais: quem recebeu um de carregar_catalogo()
+# continua com ele inteiro mesmo que o cache seja invalidado ou recarregado no meio da requisição.
+# 'atual' é (catálogo, expira_em), trocado de uma vez; 'geracao' conta as invalidações.
+_catalogo = {'atual': None, 'geracao': 0}
+catalogo_stats = {'hits': 0, 'misses': 0, 'invalidacoes': 0, 'menus_renderizados': 0}
+# Disponibilidade de cada versão já vista, para o /api/cardapio?desde=<versão> mandar só o que virou
+VERSOES_GUARDADAS = int(os.getenv('CATALOGO_VERSOES', 32))
+_versoes = OrderedDict()  # versão -> (hash sem a disponibilidade, {ID: disponivel})
+
+
+def _catalogo_em_cache():
+    """O catálogo em cache, ou None se não há um ou se passou do TTL"""
+    atual = _catalogo['atual']
+    if atual is None or time.monotonic() >= atual[1]:
+        return None
+    return atual[0]
+
+
+def catalogo_valido():
+    """Indica se o catálogo em cache ainda está dentro do TTL"""
+    return _catalogo_em_cache() is not None
+
+
+def _montar_catalogo(itens):
+    por_id = {}
+    categorias = {}
+    categoria_por_nome = {}
+    for item in itens:
+        item['imagem_url'] = item.get('imagem_url', '/static/produtos/default.png')
+        por_id[item['ID']] = item
+        categorias.setdefault(item.get('categoria', 'Sem Categoria'), []).append(item)
+        if item.get('categoria'):
+            categoria_por_nome.setdefault(item['nome'], item['categoria'])
+
+    versao = hashlib.md5(json.dumps(itens, sort_keys=True, default=str).encode('utf-8')).hexdigest()[:12]
+    if versao not in _versoes:
+        estrutura = [{k: v for k, v in item.items() if k != 'disponivel'} for item in itens]
+        _versoes[versao] = (
+            hashlib.md5(json.dumps(estrutura, sort_keys=True, default=str).encode('utf-8')).hexdigest(),
+            {item['ID']: bool(item.get('disponivel')) for item in itens}
+        )
+        while len(_versoes) > VERSOES_GUARDADAS:
+            _versoes.popitem(last=False)
+
+    logging.info("Catálogo recarregado com %d itens", len(itens))
+    return {
+        'itens': itens,
+        'por_id': por_id,
+        'categorias': categorias,
+        'categoria_por_nome': categoria_por_nome,
+        'versao': versao
+    }
+
+
+def geracao_catalogo():
+    """Contador de invalidações; passado a instalar_catalogo para não guardar uma leitura anterior a uma invalidação"""
+    return _catalogo['geracao']
+
+
+def instalar_catalogo(itens, geracao=None):
+    """Coloca no cache um catálogo lido fora do lock (em carregar_catalogo ou pelo cliente assíncrono do asgi.py)
+    e o devolve. Se o catálogo foi invalidado desde que a leitura começou, os itens valem só para esta
+    requisição: ficam instalados já expirados e a próxima requisição lê de novo."""
+    with _catalogo_lock:
+        catalogo = _montar_catalogo(itens)
+        atual = geracao is None or geracao == _catalogo['geracao']
+        _catalogo['atual'] = (catalogo, time.monotonic() + CATALOGO_TTL if atual else 0.0)
+        return catalogo
+
+
+def consulta_catalogo(cliente):
+    """Consulta da tabela itens para o catálogo. A ordem fixa mantém a versão (hash) e a ordem do cardápio
+    estáveis: sem ela, um UPDATE no Postgres muda a posição da linha na próxima leitura"""
+    return cliente.table('itens').select('*').order('ID')
+
+
+def carregar_catalogo():
+    """Retorna o catálogo (itens, índice por ID, itens agrupados por categoria e versão) do cache ou do Supabase.
+    O dicionário devolvido não muda depois: use só ele, não o cache"""
+    catalogo = _catalogo_em_cache()
+    if catalogo is not None:
+        catalogo_stats['hits'] += 1
+        return catalogo
+
+    with _recarga_lock:
+        # Outra thread pode ter recarregado enquanto esta esperava
+        catalogo = _catalogo_em_cache()
+        if catalogo is not None:
+            catalogo_stats['hits'] += 1
+            return catalogo
+        catalogo_stats['misses'] += 1
+
+        geracao = geracao_catalogo()
+        response = consulta_catalogo(supabase).execute()
+        return instalar_catalogo(response.data or [], geracao)
+
+
+def buscar_itens_por_id(ids):
+    """Retorna {ID: item} para os IDs pedidos, consultando o Supabase uma única vez só para os que faltam no cache"""
+    por_id = carregar_catalogo()['por_id']
+    itens = {}
+    faltando = []
+    for item_id in set(ids):
+        if item_id in por_id:
+            itens[item_id] = por_id[item_id]
+        else:
+            faltando.append(item_id)
+
+    if faltando:
+        # Item criado em outro worker depois da última carga do catálogo
+        response = supabase.table('itens').select('ID, nome, preco, categoria').in_('ID', faltando).execute()
+        for item in response.data or []:
+            itens[item['ID']] = item
+    return itens
+
+
+def invalidar_catalogo():
+    """Descarta o catálogo em cache após alterações na tabela itens"""
+    with _catalogo_lock:
+        _catalogo['atual'] = None
+        _catalogo['geracao'] += 1
+        catalogo_stats['invalidacoes'] += 1
+
+
+# Cache LRU id_cliente -> nome, preenchido no login/cadastro, para enviar_pedido e
+# enviar_mensagem não consultarem o Supabase só para saber o nome de quem está logado
+NOMES_CACHE_MAX = int(os.getenv('NOMES_CACHE_MAX', 2048))
+_nomes_lock = threading.Lock()
+_nomes_clientes = OrderedDict()
+
+
+def guardar_nome_cliente(id_cliente, nome):
+    with _nomes_lock:
+        _nomes_clientes[id_cliente] = nome
+        _nomes_clientes.move_to_end(id_cliente)
+        while len(_nomes_clientes) > NOMES_CACHE_MAX:
+            _nomes_clientes.popitem(last=False)
+
+
+def esquecer_nome_cliente(id_cliente):
+    with _nomes_lock:
+        _nomes_clientes.pop(id_cliente, None)
+
+
+def nome_do_cliente(id_cliente, padrao):
+    """Nome do cliente pelo cache; só consulta a tabela clientes quando não está em memória"""
+    if not id_cliente or id_cliente == 'anon':
+        return padrao
+    with _nomes_lock:
+        if id_cliente in _nomes_clientes:
+            _nomes_clientes.move_to_end(id_cliente)
+            return _nomes_clientes[id_cliente]
+
+    response = supabase.table('clientes').select('nome').eq('id_cliente', id_cliente).execute()
+    if not response.data:
+        return padrao
+    nome = response.data[0]['nome']
+    guardar_nome_cliente(id_cliente, nome)
+    return nome
+
+
+# Canal de eventos (Server-Sent Events) dos pedidos.
+# Os eventos são gravados num arquivo local append-only que todos os workers do gunicorn
+# leem, então um pedido criado num worker chega às telas conectadas em qualquer outro.
+EVENTOS_ARQUIVO = os.getenv('EVENTOS_ARQUIVO', os.path.join(tempfile.gettempdir(), 'lele_eventos.jsonl'))
+EVENTOS_MAX_BYTES = int(os.getenv('EVENTOS_MAX_BYTES', 5 * 1024 * 1024))
+SSE_INTERVALO = float(os.getenv('SSE_INTERVALO', 0.5))
+SSE_HEARTBEAT = 15
+# Cada conexão SSE ocupa uma thread do gunicorn; depois desse tempo o stream é encerrado
+# e o EventSource do navegador reconecta sozinho a partir do último id recebido
+SSE_DURACAO_MAX = float(os.getenv('SSE_DURACAO_MAX', 300))
+# Push dos pedidos (SSE) só para o painel da cozinha logado e só com PEDIDOS_PUSH=1: cada tela conectada
+# prende uma thread. Desligado (padrão), o painel e a tela pública de pedidos fazem polling em lele_data?since=
+PEDIDOS_PUSH = os.getenv('PEDIDOS_PUSH', '0') == '1'
+
+
+def publicar_evento(canal, tipo, dados):
+    """Publica um evento para as telas inscritas no canal; falhas só são logadas"""
+    linha = json.dumps({'canal': canal, 'tipo': tipo, 'dados': dados}, ensure_ascii=False, default=str) + '\n'
+    try:
+        with open(EVENTOS_ARQUIVO, 'ab') as f:
+            if fcntl:
+                fcntl.flock(f, fcntl.LOCK_EX)
+            if os.fstat(f.fileno()).st_size > EVENTOS_MAX_BYTES:
+                f.truncate(0)
+            f.write(linha.encode('utf-8'))
+    except OSError as e:
+        logging.error(f"Erro ao publicar evento {tipo}: {str(e)}")
+
+
+def tamanho_eventos():
+    """Posição atual do fim do arquivo de eventos"""
+    try:
+        return os.path.getsize(EVENTOS_ARQUIVO)
+    except OSError:
+        return 0
+
+
+def ler_eventos(posicao, canais):
+    """Lê os eventos dos canais gravados depois da posição; retorna (nova_posicao, [(posicao, evento)])"""
+    tamanho = tamanho_eventos()
+    if tamanho < posicao:  # Arquivo foi truncado, recomeça do início
+        posicao = 0
+
+    eventos = []
+    if tamanho > posicao:
+        with open(EVENTOS_ARQUIVO, 'rb') as f:
+            f.seek(posicao)
+            for linha in f:
+                if not linha.endswith(b'\n'):  # Escrita ainda em andamento
+                    break
+                posicao += len(linha)
+                try:
+                    evento = json.loads(linha)
+                except json.JSONDecodeError:
+                    continue
+                if evento.get('canal') in canais:
+                    eventos.append((posicao, evento))
+    return posicao, eventos
+
+
+def stream_eventos(canais, ultimo_id=None):
+    """Gera as mensagens SSE dos canais; o id de cada evento é a posição dele no arquivo"""
+    posicao = ultimo_id if ultimo_id is not None else tamanho_eventos()
+    inicio = ultimo_envio = time.monotonic()
+
+    yield "retry: 2000\n\n"
+    while time.monotonic() - inicio < SSE_DURACAO_MAX:
+        posicao, eventos = ler_eventos(posicao, canais)
+        for id_evento, evento in eventos:
+            dados = json.dumps(evento['dados'], ensure_ascii=False)
+            yield f"id: {id_evento}\nevent: {evento['tipo']}\ndata: {dados}\n\n"
+            ultimo_envio = time.monotonic()
+
+        if time.monotonic() - ultimo_envio > SSE_HEARTBEAT:
+            yield ": ping\n\n"
+            ultimo_envio = time.monotonic()
+        time.sleep(SSE_INTERVALO)
+
+
+def resposta_sse(canais):
+    """Monta a resposta text/event-stream retomando do Last-Event-ID enviado pelo navegador"""
+    ultimo_id = request.headers.get('Last-Event-ID') or request.args.get('ultimo_id')
+    ultimo_id = int(ultimo_id) if ultimo_id and ultimo_id.isdigit() else None
+    return Response(
+        stream_with_context(stream_eventos(canais, ultimo_id)),
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
+
+
+def evento_pedido(pedido):
+    """Versão compacta de um pedido para os eventos do painel"""
+    campos = ('pedido_numero', 'mesa', 'nome', 'contato', 'produto', 'status', 'total', 'descricao', 'data_hora')
+    return desserializar_produtos([{campo: pedido.get(campo) for campo in campos}])[0]
 
 
 # Rota para o Google Search Console
@@ -41,7 +367,7 @@ def home():
 
 @app.route('/index', methods=['GET'])
 def index():
-    logging.debug(f"Session check in /index: {session.get('autenticado_cliente')}")
+    logging.debug("Session check in /index: %s", session.get('autenticado_cliente'))
     if not session.get('autenticado_cliente'):
         return redirect(url_for('login'))
     # Checa tempo de sessão
@@ -70,6 +396,7 @@ def login():
                 session['autenticado_cliente'] = True
                 session['id_cliente'] = existing['id_cliente']
                 session.permanent = True
+                guardar_nome_cliente(existing['id_cliente'], existing['nome'])
                 app.permanent_session_lifetime = timedelta(minutes=180)
 
                 # 🔎 Aqui entra a checagem do aniversário
@@ -94,6 +421,7 @@ def login():
                     session['autenticado_cliente'] = True
                     session['id_cliente'] = id_cliente
                     session.permanent = True
+                    guardar_nome_cliente(id_cliente, nome_input)
                     app.permanent_session_lifetime = timedelta(minutes=180)
                     
                     # 🔎 novo cliente sempre terá aniversario vazio → já pede
@@ -114,6 +442,7 @@ def atualizar_aniversario():
         return jsonify({"error": "Data obrigatória"}), 400
     id_cliente = session['id_cliente']
     supabase.table('clientes').update({'aniversario': aniversario}).eq('id_cliente', id_cliente).execute()
+    esquecer_nome_cliente(id_cliente)
     return redirect(url_for('index'))
 
 
@@ -140,6 +469,7 @@ def esqueci_senha():
             return render_template('login.html', erro="Senha deve ter ao menos 6 dígitos", authenticated=False)
 
         supabase.table('clientes').update({'senha': nova_senha}).eq('id_cliente', cliente['id_cliente']).execute()
+        esquecer_nome_cliente(cliente['id_cliente'])
 
         # 🔑 Redireciona para /login com mensagem de sucesso
         return redirect(url_for('login', msg="Senha redefinida com sucesso!"))
@@ -150,19 +480,124 @@ def esqueci_senha():
 
 
 # Rota para o cardápio
+# HTML das categorias e cards do cardápio por versão do catálogo: só é renderizado de novo quando um item
+# muda (rotas /estoque/* ou edição vista depois do TTL), não a cada leitura do QR code
+MENUS_GUARDADOS = 4
+_menus_lock = threading.Lock()
+_menus = {}  # versão do catálogo -> HTML (Markup)
+
+
+def menu_renderizado():
+    """HTML de cardapio_menu.html para a versão atual do catálogo"""
+    catalogo = carregar_catalogo()
+    versao, categorias = catalogo['versao'], catalogo['categorias']
+    html = _menus.get(versao)
+    if html is None:
+        html = Markup(render_template('cardapio_menu.html', categorias=categorias, versao=versao))
+        with _menus_lock:
+            if len(_menus) >= MENUS_GUARDADOS:
+                _menus.clear()
+            _menus[versao] = html
+            catalogo_stats['menus_renderizados'] += 1
+    return html
+
+
 @app.route('/cardapio', methods=['GET'])
 def cardapio():
-    mesa = request.args.get('mesa', default='1', type=str)
-    response = supabase.table('itens').select('*').execute()
-    itens = response.data
-    categorias = {}
-    for item in itens:
-        categoria = item['categoria']
-        if categoria not in categorias:
-            categorias[categoria] = []
-        item['imagem_url'] = item.get('imagem_url', '/static/produtos/default.png')
-        categorias[categoria].append(item)
-    return render_template('cardapio.html', categorias=categorias, mesa=mesa)
+    # Só a mesa (do QR code) muda de uma requisição para outra; o menu vem pronto do cache
+    mesa = request.args.get('mesa', default='', type=str)
+    response = app.response_class(render_template('cardapio.html', menu=menu_renderizado(), mesa=mesa))
+    # ETag forte do corpo: quem volta ao cardápio sem nada ter mudado recebe 304
+    response.set_etag(hashlib.md5(response.get_data()).hexdigest())
+    response.headers['Cache-Control'] = 'no-cache'
+    return response.make_conditional(request)
+
+
+# Cardápio em JSON compacto para o navegador: preços e disponibilidade sem recarregar a página.
+# "campos" dá o nome de cada posição das linhas em "itens".
+CAMPOS_CARDAPIO = ['id', 'nome', 'preco', 'categoria', 'disponivel', 'imagem']
+_cardapios_json = {}  # versão do catálogo -> corpo JSON
+
+
+def corpo_cardapio():
+    """JSON do catálogo atual (montado uma vez por versão) e a versão"""
+    catalogo = carregar_catalogo()
+    versao, itens = catalogo['versao'], catalogo['itens']
+    corpo = _cardapios_json.get(versao)
+    if corpo is None:
+        corpo = json.dumps({
+            'versao': versao,
+            'campos': CAMPOS_CARDAPIO,
+            'itens': [[
+                item['ID'], item['nome'], item['preco'], item.get('categoria'), bool(item.get('disponivel')),
+                miniatura(item.get('imagem_url'), 150)
+            ] for item in itens]
+        }, ensure_ascii=False, separators=(',', ':'))
+        with _menus_lock:
+            if len(_cardapios_json) >= MENUS_GUARDADOS:
+                _cardapios_json.clear()
+            _cardapios_json[versao] = corpo
+    return corpo, versao
+
+
+def corpo_cardapio_delta(desde, versao):
+    """Só os itens que mudaram de disponibilidade entre as duas versões; None se isso não basta
+    (versão desconhecida neste worker, ou preço, nome ou itens diferentes)"""
+    with _catalogo_lock:
+        antes, agora = _versoes.get(desde), _versoes.get(versao)
+    if not antes or not agora or antes[0] != agora[0]:
+        return None
+    mudancas = {item_id: disponivel for item_id, disponivel in agora[1].items() if antes[1].get(item_id) != disponivel}
+    return json.dumps({'versao': versao, 'desde': desde, 'disponivel': mudancas}, ensure_ascii=False, separators=(',', ':'))
+
+
+@app.route('/api/cardapio', methods=['GET'])
+def api_cardapio():
+    # ?desde=<versão>: só as trocas de disponível/esgotado desde aquela versão (ou o cardápio inteiro,
+    # com "itens", quando mudou mais do que isso)
+    corpo, versao = corpo_cardapio()
+    desde = request.args.get('desde')
+    if desde:
+        corpo = corpo_cardapio_delta(desde, versao) or corpo
+    response = app.response_class(corpo, mimetype='application/json')
+    response.set_etag(hashlib.md5(corpo.encode('utf-8')).hexdigest())
+    response.headers['Cache-Control'] = 'no-cache'
+    return response.make_conditional(request)
+
+# Fila local dos pedidos novos (write-behind, ver fila_pedidos.py). Com FILA_PEDIDOS=1 o enviar_pedido
+# responde assim que o pedido está no diário local e uma thread grava no Supabase em lotes.
+# Precisa da coluna id_provisorio (sql/fila_pedidos.sql) e de FILA_PEDIDOS_ARQUIVO num disco persistente.
+FILA_PEDIDOS = os.getenv('FILA_PEDIDOS', '0') == '1'
+
+
+def gravar_pedidos(pedidos):
+    """Grava um lote da fila em pedidos_finalizados; um pedido já gravado (mesmo id_provisorio) é ignorado"""
+    response = supabase.table('pedidos_finalizados').upsert(pedidos, on_conflict='id_provisorio', ignore_duplicates=True).execute()
+    return response.data or []
+
+
+def pedido_gravado(pedido):
+    publicar_evento('pedidos', 'novo', evento_pedido(pedido))
+
+
+fila_pedidos = None
+if FILA_PEDIDOS:
+    if not FILA_ARQUIVO:
+        raise RuntimeError("FILA_PEDIDOS=1 exige FILA_PEDIDOS_ARQUIVO apontando para um disco persistente "
+                           "(ex.: um volume montado); no diretório temporário os pedidos pendentes se perdem "
+                           "quando a instância é reciclada")
+    fila_pedidos = FilaPedidos(FILA_ARQUIVO, gravar_pedidos, pedido_gravado)
+    fila_pedidos.iniciar()
+    atexit.register(fila_pedidos.parar)
+
+
+@app.route('/api/fila_pedidos', methods=['GET'])
+def fila_pedidos_status():
+    """Rota com o estado da fila local de pedidos (pendentes, falhas, espera do mais antigo)"""
+    if not fila_pedidos:
+        return jsonify({'ativa': False})
+    return jsonify({'ativa': True, **fila_pedidos.status()})
+
 
 @app.route('/enviar_pedido', methods=['POST'])
 def enviar_pedido():
@@ -180,31 +615,33 @@ def enviar_pedido():
         if not all([mesa, contato, itens]) or len(itens) == 0:
             return jsonify({"error": "Mesa, contato e itens são obrigatórios"}), 400
 
+        # Resolve todos os itens do carrinho de uma vez (catálogo em memória + no máximo uma consulta)
+        # e o nome do cliente logado ao mesmo tempo: são consultas independentes
+        id_cliente = session.get('id_cliente')
+        por_id, nome_cliente = em_paralelo(
+            lambda: buscar_itens_por_id(item['id'] for item in itens),
+            lambda: nome_do_cliente(id_cliente, 'Cliente Desconhecido')
+        )
         nomes_produtos = []
+        total_calculado = 0
         for item in itens:
             item_id = item['id']
-            quantidade = item['quantidade']
-            response_item = supabase.table('itens').select('nome, preco').eq('ID', item_id).execute()
-            if not response_item.data:
-                logging.warning(f"Item {item_id} não encontrado no Supabase")
+            item_data = por_id.get(item_id)
+            if not item_data:
+                logging.warning(f"Item {item_id} não encontrado no catálogo")
                 return jsonify({"error": f"Item {item_id} não encontrado"}), 404
-        
-            item_data = response_item.data[0]
+
             nome_produto = item_data['nome']
             preco_unit = item_data['preco']
             sabor = item.get('sabor', '')
             display_nome = f"{nome_produto} ({sabor}) - R$ {preco_unit}" if sabor else f"{nome_produto} - R$ {preco_unit}"
             nomes_produtos.append(display_nome)
-        
+            total_calculado += preco_unit * item['quantidade']
+
         # Recalcula total se necessário
         if total == 0:
-            total = sum(item_data['preco'] * quantidade for item in itens for item_data in supabase.table('itens').select('preco').eq('ID', item['id']).execute().data)
+            total = total_calculado
 
-        # Buscar nome do cliente logado
-        id_cliente = session.get('id_cliente')
-        response_cliente = supabase.table('clientes').select('nome').eq('id_cliente', id_cliente).execute()
-        nome_cliente = response_cliente.data[0]['nome'] if response_cliente.data else 'Cliente Desconhecido'
-        
         pedido = {
             'mesa': mesa,
             'nome': nome_cliente,  # Preenchido com nome do cliente
@@ -216,12 +653,25 @@ def enviar_pedido():
             'data_hora': datetime.now(ZoneInfo("America/Sao_Paulo")).isoformat(),
             'id_cliente': id_cliente
         }
+
+        if fila_pedidos:
+            provisorio = fila_pedidos.enfileirar(pedido)
+            registrar_presenca(id_cliente, nome_cliente, mesa)
+            return jsonify({
+                "message": "Pedido enviado com sucesso",
+                "pedido_id": provisorio,
+                "provisorio": True
+            }), 202
+
         response_insert = supabase.table('pedidos_finalizados').insert(pedido).execute()
 
         if not response_insert.data:
             logging.error(f"Erro no insert Supabase: {response_insert.text}")
             return jsonify({"error": "Falha ao inserir pedido", "detalhe": response_insert.text}), 500
 
+        publicar_evento('pedidos', 'novo', evento_pedido(response_insert.data[0]))
+        registrar_presenca(id_cliente, nome_cliente, mesa)
+
         return jsonify({
             "message": "Pedido enviado com sucesso",
             "pedido_id": response_insert.data[0]['pedido_numero']
@@ -280,26 +730,83 @@ def caixa_funcionario():
     autenticado = session.get('autenticado_funcionario', False)
     return render_template('funcionario.html', erro=None, autenticado=autenticado)
 
+def saldo_pedido(pedido):
+    """Valor ainda devido de um pedido: total menos desconto e pagamentos parciais"""
+    return (pedido.get('total') or 0) - (pedido.get('desconto') or 0) - (pedido.get('dividir1') or 0) - (pedido.get('dividir2') or 0)
+
+
+def agrupar_comandas(pedidos):
+    """Agrupa os pedidos em aberto por id_cliente com o saldo de cada comanda"""
+    grupos = {}
+    for p in pedidos:
+        if p.get('status') == 'Pago':
+            continue
+        grupo = grupos.setdefault(p['id_cliente'], {'pedidos': [], 'total': 0})
+        grupo['pedidos'].append(p)
+        grupo['total'] += saldo_pedido(p)
+    return grupos
+
+def versao_comanda(grupo):
+    """Impressão digital curta do conteúdo de uma comanda, muda a cada alteração dos pedidos"""
+    conteudo = json.dumps(grupo['pedidos'], sort_keys=True, default=str)
+    return hashlib.md5(conteudo.encode('utf-8')).hexdigest()[:12]
+
+
+def comanda_json(id_cliente, grupo):
+    """Comanda no formato das respostas JSON do caixa, com o card já renderizado"""
+    return {
+        'id_cliente': id_cliente,
+        'nome': grupo['pedidos'][0].get('nome') if grupo['pedidos'] else None,
+        'total': grupo['total'],
+        'versao': versao_comanda(grupo),
+        'pedidos': [
+            {'pedido_numero': p['pedido_numero'], 'status': p.get('status'), 'total': p.get('total'), 'saldo': saldo_pedido(p)}
+            for p in grupo['pedidos']
+        ],
+        'html': render_template('recebimento_comanda.html', id_cliente=id_cliente, grupo=grupo)
+    }
+
+
+def buscar_comanda(id_cliente):
+    """Busca só os pedidos em aberto de um cliente e devolve a comanda atualizada"""
+    response = supabase.table('pedidos_finalizados').select('*').eq('id_cliente', id_cliente).neq('status', 'Pago').order('data_hora', desc=True).execute()
+    grupo = agrupar_comandas(response.data or []).get(id_cliente, {'pedidos': [], 'total': 0})
+    return comanda_json(id_cliente, grupo)
+
 @app.route('/caixa/funcionario/recebimento', methods=['GET'])
 def caixa_recebimento():
     if not session.get('autenticado_funcionario'):
         return redirect(url_for('caixa_funcionario'))
     
-    response = supabase.table('pedidos_finalizados').select('*').order('data_hora', desc=True).execute()
-    pedidos = response.data or []
-    
-    # Agrupar por id_cliente, filtrando apenas pedidos não pagos
-    grupos = {}
-    for p in pedidos:
-        if p.get('status') != 'Pago':
-            id_c = p['id_cliente']
-            if id_c not in grupos:
-                grupos[id_c] = {'pedidos': [], 'total': 0}
-            
-            grupos[id_c]['pedidos'].append(p)
-            grupos[id_c]['total'] += p.get('total', 0) - (p.get('desconto', 0) or 0) - (p.get('dividir1', 0) or 0) - (p.get('dividir2', 0) or 0)
-    
-    return render_template('recebimento.html', grupos=grupos.items())
+    # Só os pedidos em aberto vêm do banco (índice parcial em sql/indices.sql),
+    # então o custo não cresce com o histórico de pedidos pagos
+    response = supabase.table('pedidos_finalizados').select('*').neq('status', 'Pago').order('data_hora', desc=True).execute()
+    grupos = agrupar_comandas(response.data or [])
+    versoes = {id_c: versao_comanda(grupo) for id_c, grupo in grupos.items()}
+    return render_template('recebimento.html', grupos=grupos.items(), versoes=versoes)
+
+@app.route('/caixa/funcionario/recebimento.json', methods=['GET'])
+def caixa_recebimento_json():
+    """Comandas abertas que mudaram em relação às versões que a tela já tem (?conhecidas={"id_cliente": "versao"})"""
+    if not session.get('autenticado_funcionario'):
+        return jsonify({"error": "Funcionário não autenticado"}), 401
+
+    try:
+        conhecidas = json.loads(request.args.get('conhecidas') or '{}')
+    except json.JSONDecodeError:
+        conhecidas = {}
+    if not isinstance(conhecidas, dict):
+        conhecidas = {}
+
+    response = supabase.table('pedidos_finalizados').select('*').neq('status', 'Pago').order('data_hora', desc=True).execute()
+    grupos = agrupar_comandas(response.data or [])
+
+    alteradas = [
+        comanda_json(id_c, grupo) for id_c, grupo in grupos.items()
+        if conhecidas.get(id_c) != versao_comanda(grupo)
+    ]
+    removidas = [id_c for id_c in conhecidas if id_c not in grupos]
+    return jsonify({"alteradas": alteradas, "removidas": removidas})
 
 @app.route('/caixa/funcionario/aplicar_desconto', methods=['POST'])
 def aplicar_desconto():
@@ -321,7 +828,11 @@ def aplicar_desconto():
         
         if response.data:
             logging.info(f"Desconto de R$ {desconto} aplicado para pedido {pedido_numero}")
-            return jsonify({"message": "Desconto aplicado com sucesso"}), 200
+            return jsonify({
+                "message": "Desconto aplicado com sucesso",
+                "saldo": saldo_pedido(response.data[0]),
+                "comanda": buscar_comanda(response.data[0]['id_cliente'])
+            }), 200
         else:
             return jsonify({"error": "Pedido não encontrado"}), 404
             
@@ -358,15 +869,88 @@ def pagar_parcial():
             return jsonify({"error": "Limite de pagamentos parciais atingido (2)"}), 400
         
         # Atualiza o pedido específico
-        supabase.table('pedidos_finalizados').update(update_data).eq('pedido_numero', pedido_numero).execute()
-        
+        update_response = supabase.table('pedidos_finalizados').update(update_data).eq('pedido_numero', pedido_numero).execute()
+        pedido_atualizado = update_response.data[0] if update_response.data else None
+
         logging.info(f"Pagamento parcial de R$ {valor} registrado para pedido {pedido_numero}")
-        return jsonify({"message": "Pagamento parcial registrado com sucesso"}), 200
+        return jsonify({
+            "message": "Pagamento parcial registrado com sucesso",
+            "saldo": saldo_pedido(pedido_atualizado) if pedido_atualizado else None,
+            "comanda": buscar_comanda(pedido_atualizado['id_cliente']) if pedido_atualizado else None
+        }), 200
         
     except Exception as e:
         logging.error(f"Erro ao registrar pagamento parcial: {str(e)}")
         return jsonify({"error": "Erro interno do servidor"}), 500
 
+def montar_vendas(pedidos):
+    """Converte os produtos ("NOME - R$ PRECO") dos pedidos em linhas da tabela vendas"""
+    categoria_por_nome = carregar_catalogo()['categoria_por_nome']
+    vendas = []
+    for pedido in pedidos:
+        produtos = pedido.get('produto') or []
+        if isinstance(produtos, str):  # Garante que é uma string JSONB
+            try:
+                produtos = json.loads(produtos.replace("'", '"'))  # Converte string JSONB para lista
+            except json.JSONDecodeError as e:
+                logging.error(f"Erro ao decodificar JSON para pedido {pedido.get('pedido_numero')}: {str(e)}")
+                continue
+        data_hora = pedido.get('data_hora')
+
+        for item in produtos:
+            if not isinstance(item, str):
+                continue
+            parts = item.split(' - R$ ')
+            if len(parts) != 2:
+                continue
+            nome = parts[0]
+            try:
+                preco = float(parts[1].replace(',', '.'))
+            except ValueError as e:
+                logging.error(f"Erro ao converter preço para float: {str(e)} para item {item}")
+                continue
+            vendas.append({
+                'nome': nome,
+                'categoria': categoria_por_nome.get(nome, 'Não especificada'),
+                'preco': preco,
+                'data_hora': data_hora
+            })
+    return vendas
+
+# Códigos do PostgREST/Postgres para função inexistente: o SQL de sql/ ainda não foi aplicado no banco
+FUNCAO_INEXISTENTE = {'PGRST202', '42883'}
+
+
+def registrar_vendas(vendas):
+    """Grava as vendas e soma ao consolidado diário numa única transação (função registrar_vendas,
+    ver sql/vendas_diarias.sql); devolve as linhas inseridas.
+
+    Se a função não existe no banco, grava só em vendas, como antes do consolidado: o pagamento não
+    para, e o relatoriodevendas (sem relatorio_vendas, do mesmo arquivo) agrupa a tabela vendas.
+    Qualquer outro erro é repassado, porque a função pode ter gravado antes de a resposta se perder."""
+    try:
+        return supabase.rpc('registrar_vendas', {'linhas': vendas}).execute().data or []
+    except Exception as e:
+        if getattr(e, 'code', None) not in FUNCAO_INEXISTENTE:
+            raise
+        logging.error("Função registrar_vendas não encontrada no banco (rodar sql/vendas_diarias.sql): "
+                      "gravando só em vendas, sem o consolidado vendas_diarias")
+        return supabase.table('vendas').insert(vendas).execute().data or []
+
+
+def desfazer_pagamento(pedidos, abertos):
+    """Devolve aos pedidos o status que tinham antes de pagar_comanda (um update por status)"""
+    anterior = {p['pedido_numero']: p['status'] for p in abertos}
+    por_status = {}
+    for pedido in pedidos:
+        por_status.setdefault(anterior.get(pedido['pedido_numero']), []).append(pedido['pedido_numero'])
+    for status, numeros in por_status.items():
+        try:
+            supabase.table('pedidos_finalizados').update({'status': status}).in_('pedido_numero', numeros).eq('status', 'Pago').execute()
+        except Exception as e:
+            logging.error(f"Pedidos {numeros} ficaram como Pago sem vendas gravadas (status anterior {status}): {str(e)}")
+
+
 @app.route('/caixa/funcionario/pagar_comanda', methods=['POST'])
 def pagar_comanda():
     if not session.get('autenticado_funcionario'):
@@ -380,63 +964,37 @@ def pagar_comanda():
         if not id_cliente:
             return jsonify({"error": "ID do cliente é obrigatório"}), 400
 
-        # Atualiza o status para 'Pago' na tabela pedidos_finalizados
-        update_response = supabase.table('pedidos_finalizados').update({'status': 'Pago'}).eq('id_cliente', id_cliente).execute()
-        if not update_response.data:
-            return jsonify({"error": "Nenhum pedido encontrado para atualizar"}), 404
+        # Status de cada pedido em aberto, para poder desfazer o pagamento se as vendas não forem gravadas
+        abertos = supabase.table('pedidos_finalizados').select('pedido_numero, status').eq('id_cliente', id_cliente).neq('status', 'Pago').execute().data or []
+        if not abertos:
+            return jsonify({"message": "Nenhum pedido em aberto para pagar", "vendas_inseridas": 0, "comanda": buscar_comanda(id_cliente)}), 200
+
+        # Atualiza para 'Pago' apenas os pedidos ainda em aberto; as linhas devolvidas pelo update
+        # são exatamente os pedidos pagos nesta chamada, então uma repetição não reinsere vendas
+        update_response = supabase.table('pedidos_finalizados').update({'status': 'Pago'}).in_('pedido_numero', [p['pedido_numero'] for p in abertos]).neq('status', 'Pago').execute()
+        pedidos = update_response.data or []
+        if not pedidos:
+            return jsonify({"message": "Nenhum pedido em aberto para pagar", "vendas_inseridas": 0, "comanda": buscar_comanda(id_cliente)}), 200
+
+        # Monta todas as linhas de vendas e grava num único lote, junto com o consolidado diário
+        try:
+            vendas = montar_vendas(pedidos)
+            inseridas = registrar_vendas(vendas) if vendas else []
+            vendas_inseridas = len(inseridas)
+            if vendas_inseridas != len(vendas):
+                logging.warning(f"Falha ao inserir vendas: {vendas_inseridas} de {len(vendas)} itens inseridos")
+        except Exception:
+            # Sem as vendas gravadas os pedidos voltam a ficar em aberto: uma nova tentativa paga de novo
+            desfazer_pagamento(pedidos, abertos)
+            raise
 
-        # Busca os pedidos pagos para extrair os produtos
-        pedidos_response = supabase.table('pedidos_finalizados').select('produto', 'data_hora').eq('id_cliente', id_cliente).eq('status', 'Pago').execute()
-        pedidos = pedidos_response.data or []
-
-        # Processa cada pedido e insere na tabela vendas
         for pedido in pedidos:
-            produtos = pedido.get('produto', [])
-            if isinstance(produtos, str):  # Garante que é uma string JSONB
-                import json
-                try:
-                    produtos = json.loads(produtos.replace("'", '"'))  # Converte string JSONB para lista
-                except json.JSONDecodeError as e:
-                    logging.error(f"Erro ao decodificar JSON para pedido {pedido.get('pedido_numero')}: {str(e)}")
-                    continue
-            data_hora = pedido.get('data_hora')
-        
-            for item in produtos:
-                if isinstance(item, str):
-                    parts = item.split(' - R$ ')
-                    if len(parts) == 2:
-                        nome = parts[0]
-                        try:
-                            preco = float(parts[1].replace(',', '.'))
-                            # Busca a categoria na tabela itens com base no nome do produto
-                            categoria_response = supabase.table('itens').select('categoria').eq('nome', nome).execute()
-                            categoria = categoria_response.data[0]['categoria'] if categoria_response.data and len(categoria_response.data) > 0 else 'Não especificada'
-                            insert_response = supabase.table('vendas').insert({
-                                'nome': nome,
-                                'categoria': categoria,
-                                'preco': preco,
-                                'data_hora': data_hora
-                            }).execute()
-                            if not insert_response.data:
-                                logging.warning(f"Falha ao inserir item {nome} na tabela vendas")
-                            else:
-                                logging.info(f"Item {nome} inserido com categoria {categoria}")
-                        except ValueError as e:
-                            logging.error(f"Erro ao converter preço para float: {str(e)} para item {item}")
-                            continue
-                        except Exception as e:
-                            logging.error(f"Erro ao buscar categoria para {nome}: {str(e)}")
-                            categoria = 'Não especificada'  # Fallback em caso de erro na busca
-                            insert_response = supabase.table('vendas').insert({
-                                'nome': nome,
-                                'categoria': categoria,
-                                'preco': preco,
-                                'data_hora': data_hora
-                            }).execute()
-                            if not insert_response.data:
-                                logging.warning(f"Falha ao inserir item {nome} na tabela vendas")
-
-        return jsonify({"message": "Comanda paga com sucesso"}), 200
+            publicar_evento('pedidos', 'status', {'pedido_numero': pedido['pedido_numero'], 'status': 'Pago'})
+        for venda in inseridas:
+            log_amostrado(logging.INFO, "Item %s inserido com categoria %s", venda['nome'], venda['categoria'])
+        logging.info("Comanda de %s paga: %d pedidos, %d vendas", id_cliente, len(pedidos), vendas_inseridas)
+
+        return jsonify({"message": "Comanda paga com sucesso", "vendas_inseridas": vendas_inseridas, "comanda": buscar_comanda(id_cliente)}), 200
     except Exception as e:
         logging.error(f"Erro ao pagar comanda: {str(e)}")
         return jsonify({"error": str(e)}), 500
@@ -449,32 +1007,27 @@ def estoque():
         return redirect(url_for('caixa_funcionario'))
     
     try:
-        # Carrega todos os itens da tabela 'itens' (mesma tabela do cardápio)
-        response = supabase.table('itens').select('*').execute()
-        itens = response.data or []
-        
+        # Carrega todos os itens da tabela 'itens' (mesmo catálogo em cache do cardápio)
+        catalogo = carregar_catalogo()
+        itens = catalogo['itens']
+
         # Organiza por categoria (mantendo compatibilidade com o cardápio)
         categorias = {}
-        for item in itens:
-            categoria = item.get('categoria', 'Sem Categoria')
-            if categoria not in categorias:
-                categorias[categoria] = []
-            
+        for categoria, itens_categoria in catalogo['categorias'].items():
             # Formata o item para o template
-            categorias[categoria].append({
+            categorias[categoria] = [{
                 'ID': item['ID'],  # Mantém o campo ID existente
                 'nome': item['nome'],
                 'descricao': item.get('descricao', ''),
                 'preco': float(item['preco']),
-                'imagem_url': item.get('imagem_url', '/static/produtos/default.png'),
+                'imagem_url': item['imagem_url'],
                 'disponivel': item.get('disponivel', True)  # Se não existir, assume True
-            })
-        
+            } for item in itens_categoria]
+
         # Obter categorias únicas para o pop-up
-        categorias_response = supabase.table('itens').select('categoria').execute()
-        categorias_pop_up = sorted(set(c['categoria'] for c in categorias_response.data if c.get('categoria')))
+        categorias_pop_up = sorted(set(i['categoria'] for i in itens if i.get('categoria')))
         
-        logging.info(f"Carregando estoque com {len(itens)} itens em {len(categorias)} categorias")
+        logging.info("Carregando estoque com %d itens em %d categorias", len(itens), len(categorias))
         return render_template('estoque.html', categorias=categorias, categorias_pop_up=categorias_pop_up)
     
     except Exception as e:
@@ -500,6 +1053,7 @@ def update_estoque():
         response = supabase.table('itens').update({'disponivel': disponivel}).eq('ID', item_id).execute()
         
         if response.data:
+            invalidar_catalogo()
             logging.info(f"Item {item_id} atualizado para disponivel={disponivel}")
             return jsonify({"success": True, "message": "Disponibilidade atualizada"}), 200
         else:
@@ -546,6 +1100,7 @@ def estoque_adicionar():
         }
         response = supabase.table('itens').insert(new_item).execute()
         if response.data:
+            invalidar_catalogo()
             logging.info(f"Produto {nome} adicionado com ID {id_value}")
             return jsonify({"success": True})
         return jsonify({"success": False, "error": "Erro ao adicionar item"}), 500
@@ -573,6 +1128,7 @@ def estoque_excluir():
         # Excluir o item
         response = supabase.table('itens').delete().eq('ID', item_id).execute()
         if response.data:
+            invalidar_catalogo()
             logging.info(f"Item {item_id} excluído com sucesso")
             return jsonify({"success": True})
         return jsonify({"success": False, "error": "Item não encontrado"}), 404
@@ -580,6 +1136,160 @@ def estoque_excluir():
         logging.error(f"Erro ao excluir produto: {str(e)}")
         return jsonify({"error": "Erro interno do servidor", "detalhe": str(e)}), 500
 
+@app.route('/api/supabase/pool', methods=['GET'])
+def supabase_pool():
+    """Rota com as métricas do pool de conexões HTTP com o Supabase deste worker"""
+    return jsonify(status_pool())
+
+@app.route('/api/catalogo/cache', methods=['GET'])
+def catalogo_cache():
+    """Rota com os contadores do cache do catálogo deste worker"""
+    return jsonify({**catalogo_stats, 'pid': os.getpid(), 'ttl': CATALOGO_TTL})
+
+# Instrumentação por requisição: quantas chamadas ao backend cada rota fez e quanto tempo levaram.
+# Com LOG_REQUISICOES=1 cada requisição gera uma linha JSON no log; acima de REQUISICAO_LENTA_MS
+# a linha sai como warning junto com o rastreio das consultas. Os agregados por rota saem em /metrics.
+LOG_REQUISICOES = os.getenv('LOG_REQUISICOES', '0') == '1'
+REQUISICAO_LENTA_MS = float(os.getenv('REQUISICAO_LENTA_MS', 1000))
+METRICAS_BUCKETS = (0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+_metricas_lock = threading.Lock()
+metricas_rotas = {}
+
+
+@app.before_request
+def iniciar_instrumentacao():
+    g.inicio_requisicao = time.perf_counter()
+    iniciar_rastreio()
+
+
+@app.after_request
+def registrar_instrumentacao(response):
+    inicio = g.pop('inicio_requisicao', None)
+    consultas = encerrar_rastreio()
+    if inicio is None:
+        return response
+
+    duracao = time.perf_counter() - inicio
+    tempo_consultas = sum(d for _, d in consultas)
+    rota = request.url_rule.rule if request.url_rule else 'sem_rota'
+
+    with _metricas_lock:
+        m = metricas_rotas.setdefault((rota, request.method, response.status_code), {
+            'requisicoes': 0, 'segundos': 0.0, 'consultas': 0, 'consultas_segundos': 0.0,
+            'buckets': [0] * len(METRICAS_BUCKETS)
+        })
+        m['requisicoes'] += 1
+        m['segundos'] += duracao
+        m['consultas'] += len(consultas)
+        m['consultas_segundos'] += tempo_consultas
+        for i, limite in enumerate(METRICAS_BUCKETS):
+            if duracao <= limite:
+                m['buckets'][i] += 1
+
+    response.headers['Server-Timing'] = f'db;dur={tempo_consultas * 1000:.1f};desc="{len(consultas)} consultas", total;dur={duracao * 1000:.1f}'
+
+    lenta = duracao * 1000 >= REQUISICAO_LENTA_MS
+    if LOG_REQUISICOES or lenta:
+        linha = {
+            'rota': rota,
+            'metodo': request.method,
+            'status': response.status_code,
+            'ms': round(duracao * 1000, 1),
+            'consultas': len(consultas),
+            'consultas_ms': round(tempo_consultas * 1000, 1)
+        }
+        if lenta:
+            linha['rastreio'] = [{'consulta': c, 'ms': round(d * 1000, 1)} for c, d in consultas]
+            logging.warning("requisicao_lenta %s", json.dumps(linha, ensure_ascii=False))
+        else:
+            logging.info("requisicao %s", json.dumps(linha, ensure_ascii=False))
+    return response
+
+
+def rotulos(**valores):
+    """Formata rótulos no formato de texto do Prometheus"""
+    partes = []
+    for chave, valor in valores.items():
+        valor = str(valor).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+        partes.append(f'{chave}="{valor}"')
+    return '{' + ','.join(partes) + '}'
+
+
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    """Rota com as métricas por rota deste worker no formato de texto do Prometheus"""
+    with _metricas_lock:
+        copia = {chave: {**m, 'buckets': list(m['buckets'])} for chave, m in metricas_rotas.items()}
+
+    linhas = [
+        '# HELP lele_requisicao_segundos Duração das requisições por rota.',
+        '# TYPE lele_requisicao_segundos histogram'
+    ]
+    for (rota, metodo, status), m in sorted(copia.items()):
+        for limite, quantidade in zip(METRICAS_BUCKETS, m['buckets']):
+            linhas.append(f"lele_requisicao_segundos_bucket{rotulos(rota=rota, metodo=metodo, status=status, le=limite)} {quantidade}")
+        linhas.append(f"lele_requisicao_segundos_bucket{rotulos(rota=rota, metodo=metodo, status=status, le='+Inf')} {m['requisicoes']}")
+        linhas.append(f"lele_requisicao_segundos_sum{rotulos(rota=rota, metodo=metodo, status=status)} {m['segundos']:.6f}")
+        linhas.append(f"lele_requisicao_segundos_count{rotulos(rota=rota, metodo=metodo, status=status)} {m['requisicoes']}")
+
+    linhas += ['# HELP lele_consultas_total Chamadas ao backend feitas pelas requisições da rota.', '# TYPE lele_consultas_total counter']
+    for (rota, metodo, status), m in sorted(copia.items()):
+        linhas.append(f"lele_consultas_total{rotulos(rota=rota, metodo=metodo, status=status)} {m['consultas']}")
+
+    linhas += ['# HELP lele_consultas_segundos_total Tempo gasto nas chamadas ao backend pela rota.', '# TYPE lele_consultas_segundos_total counter']
+    for (rota, metodo, status), m in sorted(copia.items()):
+        linhas.append(f"lele_consultas_segundos_total{rotulos(rota=rota, metodo=metodo, status=status)} {m['consultas_segundos']:.6f}")
+
+    pool = status_pool()
+    linhas += ['# HELP lele_supabase_pool Contadores do pool HTTP com o Supabase.', '# TYPE lele_supabase_pool gauge']
+    for chave in ('requisicoes', 'em_uso', 'pico', 'saturado', 'pool_timeouts', 'retentativas', 'erros', 'max_conexoes'):
+        linhas.append(f"lele_supabase_pool{rotulos(contador=chave)} {pool[chave]}")
+    linhas.append(f"lele_worker_info{rotulos(pid=os.getpid())} 1")
+
+    return Response('\n'.join(linhas) + '\n', mimetype='text/plain; version=0.0.4')
+
+# Paginação do relatório financeiro (keyset em data_hora, pedido_numero)
+RELATORIO_JANELA_DIAS = int(os.getenv('RELATORIO_JANELA_DIAS', 7))
+RELATORIO_POR_PAGINA = 50
+RELATORIO_POR_PAGINA_MAX = 500
+
+
+def filtrar_pedidos(query, status, nome, data_inicio, data_fim):
+    """Aplica os filtros do relatório financeiro a uma query de pedidos_finalizados"""
+    # filtro por status
+    if status:
+        query = query.eq('status', status)
+
+    # busca por nome
+    if nome:
+        query = query.ilike('nome', f"%{nome}%")
+
+    # busca por intervalo de datas
+    if data_inicio:
+        query = query.gte('data_hora', f"{data_inicio} 00:00:00")
+    if data_fim:
+        query = query.lte('data_hora', f"{data_fim} 23:59:59")
+    return query
+
+
+def totais_relatorio(status, nome, data_inicio, data_fim):
+    """Total vendido, número de pedidos e pedidos pagos do filtro, somados no banco
+    (função totais_pedidos, ver sql/relatorio_financeiro.sql)"""
+    try:
+        response = supabase.rpc('totais_pedidos', {
+            'status_busca': status or None,
+            'nome_busca': nome or None,
+            'data_inicio': f"{data_inicio} 00:00:00" if data_inicio else None,
+            'data_fim': f"{data_fim} 23:59:59" if data_fim else None
+        }).execute()
+        linha = (response.data or [{}])[0]
+        return float(linha.get('total_vendido') or 0), linha.get('total_pedidos') or 0, linha.get('pedidos_pagos') or 0
+    except Exception as e:
+        logging.warning(f"Função totais_pedidos indisponível, somando os pedidos do filtro: {str(e)}")
+        totais = filtrar_pedidos(supabase.table('pedidos_finalizados').select('total, status'), status, nome, data_inicio, data_fim).execute().data or []
+        return sum(p.get('total') or 0 for p in totais), len(totais), len([p for p in totais if p.get('status') == 'Pago'])
+
+
 @app.route('/caixa/funcionario/relatoriofinanceiro', methods=['GET'])
 def caixa_relatoriofinanceiro():
     if not session.get('autenticado_funcionario'):
@@ -592,27 +1302,36 @@ def caixa_relatoriofinanceiro():
         data_inicio = request.args.get('data_inicio', '')
         data_fim = request.args.get('data_fim', '')
 
-        query = supabase.table('pedidos_finalizados').select('*')
-
-        # filtro por status
-        if status:
-            query = query.eq('status', status)
-
-        # busca por nome
-        if nome:
-            query = query.ilike('nome', f"%{nome}%")
-
-        # busca por intervalo de datas
-        if data_inicio and data_fim:
-            query = query.gte('data_hora', f"{data_inicio} 00:00:00").lte('data_hora', f"{data_fim} 23:59:59")
-        elif data_inicio:
-            query = query.gte('data_hora', f"{data_inicio} 00:00:00")
-        elif data_fim:
-            query = query.lte('data_hora', f"{data_fim} 23:59:59")
-
-        # executa
-        response = query.order('data_hora', desc=True).execute()
+        # sem datas, mostra só os últimos dias em vez do histórico inteiro
+        if not data_inicio and not data_fim:
+            data_inicio = (datetime.now(ZoneInfo("America/Sao_Paulo")) - timedelta(days=RELATORIO_JANELA_DIAS)).strftime('%Y-%m-%d')
+
+        # --- paginação: tamanho da página e cursor (último pedido da página anterior) ---
+        por_pagina = request.args.get('por_pagina', RELATORIO_POR_PAGINA, type=int)
+        por_pagina = max(1, min(por_pagina, RELATORIO_POR_PAGINA_MAX))
+        cursor_data = request.args.get('cursor_data', '')
+        cursor_pedido = request.args.get('cursor_pedido', type=int)
+
+        query = filtrar_pedidos(supabase.table('pedidos_finalizados').select('*'), status, nome, data_inicio, data_fim)
+        if cursor_data and cursor_pedido is not None:
+            query = query.or_(f'data_hora.lt."{cursor_data}",and(data_hora.eq."{cursor_data}",pedido_numero.lt.{cursor_pedido})')
+
+        # executa a página (um registro a mais só para saber se existe próxima página) e as métricas sobre o
+        # filtro inteiro, não só a página, ao mesmo tempo
+        response, (total_vendido, total_pedidos, pedidos_pagos) = em_paralelo(
+            query.order('data_hora', desc=True).order('pedido_numero', desc=True).limit(por_pagina + 1).execute,
+            lambda: totais_relatorio(status, nome, data_inicio, data_fim)
+        )
         pedidos = response.data or []
+        proxima_pagina = None
+        if len(pedidos) > por_pagina:
+            pedidos = pedidos[:por_pagina]
+            ultimo = pedidos[-1]
+            proxima_pagina = url_for(
+                'caixa_relatoriofinanceiro',
+                nome=nome, status=status, data_inicio=data_inicio, data_fim=data_fim, por_pagina=por_pagina,
+                cursor_data=ultimo['data_hora'], cursor_pedido=ultimo['pedido_numero']
+            )
 
         # ajusta fuso horário para São Paulo
         tz = pytz.timezone("America/Sao_Paulo")
@@ -624,10 +1343,6 @@ def caixa_relatoriofinanceiro():
                 except:
                     pass
 
-        # métricas ajustadas
-        total_vendido = sum(p.get('total', 0) for p in pedidos)
-        total_pedidos = len(pedidos)
-        pedidos_pagos = len([p for p in pedidos if p.get('status') == 'Pago'])
         pedidos_abertos = total_pedidos - pedidos_pagos
 
         return render_template(
@@ -640,12 +1355,57 @@ def caixa_relatoriofinanceiro():
             nome_filtro=nome,
             status_filtro=status,
             data_inicio=data_inicio,
-            data_fim=data_fim
+            data_fim=data_fim,
+            por_pagina=por_pagina,
+            proxima_pagina=proxima_pagina,
+            primeira_pagina=url_for(
+                'caixa_relatoriofinanceiro',
+                nome=nome, status=status, data_inicio=data_inicio, data_fim=data_fim, por_pagina=por_pagina
+            ) if cursor_data else None
         )
     except Exception as e:
         logging.error(f"Erro ao carregar relatório: {str(e)}")
         return render_template('relatoriofinanceiro.html', pedidos=[], total_vendido=0, total_pedidos=0, pedidos_pagos=0, pedidos_abertos=0)
 
+def agrupar_vendas(nome, data_inicio, data_fim, categoria_filtro):
+    """Agrupa por produto as linhas brutas da tabela vendas (usado se o consolidado não existir)"""
+    # Construção da query para a tabela vendas
+    query = supabase.table('vendas').select('nome, categoria, preco')
+
+    # Filtro por nome do produto
+    if nome:
+        query = query.ilike('nome', f"%{nome}%")
+
+    # Filtro por intervalo de datas
+    if data_inicio:
+        query = query.gte('data_hora', f"{data_inicio} 00:00:00")
+    if data_fim:
+        query = query.lte('data_hora', f"{data_fim} 23:59:59")
+
+    # Filtro por categoria (aplicado se não for vazio, ignorando "Todas")
+    if categoria_filtro:
+        query = query.eq('categoria', categoria_filtro)
+
+    # Executa a query com ordenação por data_hora descendente
+    response = query.order('data_hora', desc=True).execute()
+
+    # Unifica itens por nome
+    vendas_unificadas = {}
+    for v in response.data or []:
+        nome_produto = v['nome']
+        if nome_produto not in vendas_unificadas:
+            vendas_unificadas[nome_produto] = {
+                'nome': nome_produto,
+                'categoria': v.get('categoria', 'Não especificada'),
+                'preco': v['preco'],
+                'quantidade': 0,
+                'valor_total': 0.0
+            }
+        vendas_unificadas[nome_produto]['quantidade'] += 1
+        vendas_unificadas[nome_produto]['valor_total'] += v['preco']
+
+    return list(vendas_unificadas.values())
+
 @app.route('/caixa/funcionario/relatoriodevendas', methods=['GET'])
 def caixa_relatoriodevendas():
     if not session.get('autenticado_funcionario'):
@@ -658,54 +1418,28 @@ def caixa_relatoriodevendas():
         data_fim = request.args.get('data_fim', '')
         categoria_filtro = request.args.get('categoria', '')
 
-        # Obter categorias únicas da tabela vendas
-        categorias_response = supabase.table('vendas').select('categoria').execute()
-        categorias_set = set()
-        if categorias_response.data:
-            for c in categorias_response.data:
-                if c.get('categoria'):  # Verifica se a categoria existe e não é nula
-                    categorias_set.add(c['categoria'])
-        categorias = sorted(list(categorias_set))  # Converte para lista ordenada
-
-        # Construção da query para a tabela vendas
-        query = supabase.table('vendas').select('*')
-
-        # Filtro por nome do produto
-        if nome:
-            query = query.ilike('nome', f"%{nome}%")
-
-        # Filtro por intervalo de datas
-        if data_inicio and data_fim:
-            query = query.gte('data_hora', f"{data_inicio} 00:00:00").lte('data_hora', f"{data_fim} 23:59:59")
-        elif data_inicio:
-            query = query.gte('data_hora', f"{data_inicio} 00:00:00")
-        elif data_fim:
-            query = query.lte('data_hora', f"{data_fim} 23:59:59")
-
-        # Filtro por categoria (aplicado se não for vazio, ignorando "Todas")
-        if categoria_filtro and categoria_filtro != '':
-            query = query.eq('categoria', categoria_filtro)
-
-        # Executa a query com ordenação por data_hora descendente
-        response = query.order('data_hora', desc=True).execute()
-        vendas_raw = response.data or []
-
-        # Unifica itens por nome
-        vendas_unificadas = {}
-        for v in vendas_raw:
-            nome_produto = v['nome']
-            if nome_produto not in vendas_unificadas:
-                vendas_unificadas[nome_produto] = {
-                    'nome': nome_produto,
-                    'categoria': v.get('categoria', 'Não especificada'),
-                    'preco': v['preco'],
-                    'quantidade': 0,
-                    'valor_total': 0.0
-                }
-            vendas_unificadas[nome_produto]['quantidade'] += 1
-            vendas_unificadas[nome_produto]['valor_total'] += v['preco']
-
-        vendas = list(vendas_unificadas.values())
+        def ler_vendas():
+            # Lê o consolidado diário já agrupado por produto (poucas centenas de linhas)
+            try:
+                response = supabase.rpc('relatorio_vendas', {
+                    'data_inicio': data_inicio or None,
+                    'data_fim': data_fim or None,
+                    'nome_busca': nome or None,
+                    'categoria_busca': categoria_filtro or None
+                }).execute()
+                return response.data or []
+            except Exception as e:
+                logging.warning(f"Consolidado vendas_diarias indisponível, agrupando a tabela vendas: {str(e)}")
+                return agrupar_vendas(nome, data_inicio, data_fim, categoria_filtro)
+
+        # Relatório e catálogo (para as categorias do filtro) são consultados ao mesmo tempo
+        vendas, catalogo = em_paralelo(ler_vendas, carregar_catalogo)
+
+        # Categorias para o filtro: as do catálogo mais as que aparecem no relatório
+        categorias_set = {c for c in catalogo['categorias'] if c}
+        categorias_set.update(v['categoria'] for v in vendas if v.get('categoria'))
+        categorias_set.add('Não especificada')
+        categorias = sorted(categorias_set)
 
         # Métricas ajustadas
         total_vendido = sum(v['valor_total'] for v in vendas)
@@ -733,12 +1467,39 @@ def meus_pedidos():
     id_cliente = session.get('id_cliente')
     response = supabase.table('pedidos_finalizados').select('*').eq('id_cliente', id_cliente).execute()
     pedidos = response.data or []
+    if fila_pedidos:
+        # Pedidos ainda na fila local aparecem com o número provisório até chegarem ao banco
+        gravados = {p.get('id_provisorio') for p in pedidos}
+        pedidos += [{**p, 'pedido_numero': p['id_provisorio'], 'status': 'Enviando'}
+                    for p in fila_pedidos.pendentes(id_cliente) if p['id_provisorio'] not in gravados]
     return render_template('pedidos/meuspedidos.html', pedidos=pedidos)
 
+# Janela padrão (em horas) dos pedidos mostrados no painel da cozinha: cobre um expediente inteiro
+COZINHA_JANELA_HORAS = float(os.getenv('COZINHA_JANELA_HORAS', 12))
+
+
+def inicio_janela_cozinha():
+    """Retorna o início (ISO 8601, UTC) da janela de pedidos do painel da cozinha"""
+    return (datetime.utcnow() - timedelta(hours=COZINHA_JANELA_HORAS)).isoformat()
+
+
+def desserializar_produtos(pedidos):
+    """Garante que o campo produto de cada pedido é uma lista"""
+    for p in pedidos:
+        if p.get('produto') is None:
+            p['produto'] = []
+        elif isinstance(p.get('produto'), str):
+            try:
+                p['produto'] = json.loads(p['produto']) if p['produto'] else []
+            except json.JSONDecodeError:
+                p['produto'] = []
+        # Já array, mantém
+    return pedidos
+
 # rota para pedidos/lele
 @app.route('/pedidos/lele', methods=['GET', 'POST'])
 def pedidos_lele():
-    logging.debug(f"Request method: {request.method}, Session: {session.get('autenticado_lele')}")
+    logging.debug("Request method: %s, Session: %s", request.method, session.get('autenticado_lele'))
     if request.method == 'POST':
         senha = request.form.get('senha')
         if senha == 'cecilele25': 
@@ -748,20 +1509,11 @@ def pedidos_lele():
             return redirect(url_for('pedidos_lele'))
         return render_template('pedidos/lele.html', erro="Senha incorreta", pedidos=[], authenticated=False)
     elif session.get('autenticado_lele') is True:
-        response = supabase.table('pedidos_finalizados').select('*').order('pedido_numero', desc=True).execute()
-        logging.debug(f"Response data: {response.data}")
-        pedidos = response.data or []
-        for p in pedidos:
-            if p.get('produto') is None:
-                p['produto'] = []
-            elif isinstance(p.get('produto'), str):
-                try:
-                    p['produto'] = json.loads(p['produto'])
-                except json.JSONDecodeError:
-                    p['produto'] = []
-            # Já array, mantém
-        logging.info(f"Carregando {len(pedidos)} pedidos pra template")
-        return render_template('pedidos/lele.html', pedidos=pedidos, authenticated=True)
+        # Só os pedidos da janela do expediente, não o histórico inteiro
+        response = supabase.table('pedidos_finalizados').select('*').gte('data_hora', inicio_janela_cozinha()).order('pedido_numero', desc=True).execute()
+        pedidos = desserializar_produtos(response.data or [])
+        logging.info("Carregando %d pedidos pra template", len(pedidos))
+        return render_template('pedidos/lele.html', pedidos=pedidos, authenticated=True, pedidos_push=PEDIDOS_PUSH)
     return render_template('pedidos/lele.html', pedidos=[], authenticated=False)
     
 # rota para atualização de status
@@ -771,7 +1523,9 @@ def update_status(pedido_numero):
     new_status = data.get('status')
     valid_statuses = ['Em Preparo', 'Preparado', 'Entregue']
     if new_status in valid_statuses:
-        supabase.table('pedidos_finalizados').update({'status': new_status}).eq('pedido_numero', pedido_numero).execute()
+        response = supabase.table('pedidos_finalizados').update({'status': new_status}).eq('pedido_numero', pedido_numero).execute()
+        if response.data:
+            publicar_evento('pedidos', 'status', {'pedido_numero': pedido_numero, 'status': new_status})
         return '', 200
     return '', 400
     
@@ -781,7 +1535,9 @@ def delete_pedido(pedido_numero):
     response = supabase.table('pedidos_finalizados').delete().eq('pedido_numero', pedido_numero).execute()
     if response.data:
         logging.info(f"Pedido {pedido_numero} excluído")
-        return jsonify({"message": "Pedido excluído"}), 200
+        publicar_evento('pedidos', 'excluido', {'pedido_numero': pedido_numero})
+        comanda = buscar_comanda(response.data[0]['id_cliente']) if response.data[0].get('id_cliente') else None
+        return jsonify({"message": "Pedido excluído", "comanda": comanda}), 200
     return jsonify({"error": "Falha ao excluir", "detalhe": str(response.error)}), 500
 
 # Nova rota para adicionar observação
@@ -812,6 +1568,7 @@ def add_observacao(pedido_numero):
 
         # Atualiza o pedido
         supabase.table('pedidos_finalizados').update(update_data).eq('pedido_numero', pedido_numero).execute()
+        publicar_evento('pedidos', 'observacao', {'pedido_numero': pedido_numero, **update_data})
         return jsonify({"message": "Observação adicionada com sucesso"}), 200
 
     except Exception as e:
@@ -819,41 +1576,109 @@ def add_observacao(pedido_numero):
         return jsonify({"error": "Erro interno no servidor"}), 500
 
 # Rota /pedidos/lele_data (pra simulação, substitua por /pedidos/lele depois)
+# Sem parâmetros devolve a lista de pedidos da janela do expediente.
+# Com ?since=<pedido_numero> devolve só o delta para o painel fazer polling barato:
+#   novos   -> pedidos completos com número maior que o cursor
+#   status  -> estado compacto (status e observações) dos pedidos já conhecidos da janela;
+#              pedidos que sumirem da lista foram excluídos
+#   cursor  -> maior pedido_numero visto, para a próxima chamada
 @app.route('/pedidos/lele_data', methods=['GET'])
 def pedidos_lele_data():
-    response = supabase.table('pedidos_finalizados').select('*').order('pedido_numero', desc=True).execute()
-    pedidos = response.data or []
-    for p in pedidos:
-        if isinstance(p.get('produto'), str):
-            p['produto'] = json.loads(p['produto']) if p['produto'] else []
-    return jsonify(pedidos)
+    since = request.args.get('since', type=int)
+    consultas = consultas_cozinha(supabase, since)
+    return jsonify(resposta_cozinha(since, *[c.execute() for c in consultas]))
+
+
+def consultas_cozinha(cliente, since):
+    """Consultas do painel da cozinha: a janela inteira ou, com since, os novos e o status dos já vistos"""
+    inicio = inicio_janela_cozinha()
+    pedidos = cliente.table('pedidos_finalizados')
+    if since is None:
+        return [pedidos.select('*').gte('data_hora', inicio).order('pedido_numero', desc=True)]
+    return [
+        pedidos.select('*').gte('data_hora', inicio).gt('pedido_numero', since).order('pedido_numero', desc=True),
+        cliente.table('pedidos_finalizados').select('pedido_numero, status, obs2, obs3, obs4').gte('data_hora', inicio).lte('pedido_numero', since).order('pedido_numero', desc=True)
+    ]
+
+
+def resposta_cozinha(since, response, status_response=None):
+    """Monta o corpo de /pedidos/lele_data a partir do resultado de consultas_cozinha"""
+    if since is None:
+        return desserializar_produtos(response.data or [])
+
+    novos = desserializar_produtos(response.data or [])
+    cursor = max([since] + [p['pedido_numero'] for p in novos])
+    return {
+        "cursor": cursor,
+        "novos": novos,
+        "status": status_response.data or []
+    }
+
+# Stream SSE dos pedidos para o painel da cozinha (PEDIDOS_PUSH=1).
+# Eventos: novo (pedido compacto), status, observacao e excluido
+@app.route('/pedidos/eventos', methods=['GET'])
+def pedidos_eventos():
+    if not PEDIDOS_PUSH:
+        return '', 204  # 204 faz o EventSource parar de reconectar
+    if session.get('autenticado_lele') is not True:
+        return jsonify({"error": "Acesso restrito ao painel da cozinha"}), 401
+    return resposta_sse({'pedidos'})
+
+# Entrega das mensagens do chat por push (SSE). Cada tela conectada ocupa uma thread do
+# gunicorn, então só é ligado (e só para clientes logados) quando há threads de sobra; senão o chat faz polling com cursor
+CHAT_PUSH = os.getenv('CHAT_PUSH', '0') == '1'
 
 @app.route("/social")
 def social():
     if session.get('autenticado_cliente'):
-        return render_template("social.html")
+        return render_template("social.html", chat_push=CHAT_PUSH)
     return redirect(url_for('login'))
 
-@app.route("/api/mensagens", methods=["GET"])
-def listar_mensagens():
-    chat_id = request.args.get("chat_id")
-    if not chat_id:
-        return jsonify({"error": "chat_id obrigatório"}), 400
-
-    # Calcula 3 horas atrás
+def consulta_mensagens(cliente, chat_id, after_id=None, after_created_at=None):
+    """Monta a consulta das mensagens de um chat (cliente síncrono de lele.py ou assíncrono de asgi.py)"""
+    # Calcula 5 horas atrás
     hora_limite = datetime.utcnow() - timedelta(hours=5)
     hora_limite_iso = hora_limite.isoformat()  # formato ISO 8601
 
     # Busca mensagens
-    data = supabase.table("mensagens") \
+    query = cliente.table("mensagens") \
         .select("*") \
         .eq("chat_id", chat_id) \
-        .gte("created_at", hora_limite_iso) \
-        .order("created_at", desc=False) \
-        .execute()
+        .gte("created_at", hora_limite_iso)
+
+    # Cursor: só as mensagens depois da última que o cliente já tem
+    if after_id is not None:
+        query = query.gt("id", after_id)
+    elif after_created_at:
+        query = query.gt("created_at", after_created_at)
+
+    return query.order("created_at", desc=False)
+
+
+@app.route("/api/mensagens", methods=["GET"])
+def listar_mensagens():
+    chat_id = request.args.get("chat_id")
+    if not chat_id:
+        return jsonify({"error": "chat_id obrigatório"}), 400
+
+    query = consulta_mensagens(supabase, chat_id, request.args.get("after_id", type=int), request.args.get("after_created_at"))
+    data = query.execute()
 
     return jsonify(data.data)
 
+
+@app.route("/api/mensagens/eventos", methods=["GET"])
+def mensagens_eventos():
+    """Stream SSE com as mensagens novas de um chat, publicadas por enviar_mensagem"""
+    if not CHAT_PUSH:
+        return '', 204  # 204 faz o EventSource parar de reconectar
+    if not session.get('autenticado_cliente'):
+        return jsonify({"error": "Usuário não logado, faça login primeiro"}), 401
+    chat_id = request.args.get("chat_id")
+    if not chat_id:
+        return jsonify({"error": "chat_id obrigatório"}), 400
+    return resposta_sse({f"chat:{chat_id}"})
+
 @app.route("/api/mensagens", methods=["POST"])
 def enviar_mensagem():
     body = request.json
@@ -863,15 +1688,7 @@ def enviar_mensagem():
     # Busca o nome real do cliente se não fornecido
     nome = body.get("nome")
     if nome in [None, "Anônimo", "anon"]:
-        cliente = supabase.table("pedidos_finalizados") \
-            .select("nome") \
-            .eq("id_cliente", body.get("id_cliente")) \
-            .limit(1) \
-            .execute()
-        if cliente.data:
-            nome = cliente.data[0].get("nome", "Anônimo")
-        else:
-            nome = "Anônimo"
+        nome = nome_do_cliente(body.get("id_cliente"), "Anônimo")
 
     nova = supabase.table("mensagens").insert({
         "chat_id": body["chat_id"],
@@ -881,31 +1698,121 @@ def enviar_mensagem():
         "mensagem": body["mensagem"]
     }).execute()
 
+    publicar_evento(f"chat:{body['chat_id']}", 'mensagem', nova.data[0])
+    registrar_presenca(body.get("id_cliente"), nome, body.get("mesa"))
     return jsonify(nova.data[0])
 
 
-@app.route("/api/usuarios_online", methods=["GET"])
-def usuarios_online():
-    hora_limite = datetime.utcnow() - timedelta(hours=12)
-    hora_limite_iso = hora_limite.isoformat()
+# Presença ("usuários online") em memória, por worker.
+# Sincroniza com o banco a cada PRESENCA_SINCRONIZAR segundos e, entre uma sincronização e outra,
+# é alimentada pelos eventos do canal 'presenca' (publicados por enviar_pedido e enviar_mensagem
+# em qualquer worker), então o endpoint responde da memória.
+PRESENCA_HORAS = 12
+PRESENCA_SINCRONIZAR = float(os.getenv('PRESENCA_SINCRONIZAR', 600))
+_presenca_lock = threading.Lock()
+# Uma sincronização com o banco por vez; a consulta roda fora de _presenca_lock
+_presenca_sincronizacao = threading.Lock()
+_presenca = {'usuarios': {}, 'posicao': None, 'sincronizado_em': None}
+
+
+def registrar_presenca(id_cliente, nome, mesa):
+    """Avisa todos os workers que o cliente está ativo"""
+    if not id_cliente or id_cliente == 'anon':
+        return
+    publicar_evento('presenca', 'online', {'id_cliente': id_cliente, 'nome': nome, 'mesa': mesa})
+
+
+def instante_pedido(data_hora, padrao):
+    """data_hora de um pedido em segundos (time.time()); sem fuso é UTC, como o banco grava"""
+    try:
+        dt = datetime.fromisoformat(str(data_hora).replace("Z", "+00:00"))
+    except ValueError:
+        return padrao
+    if dt.tzinfo is None:
+        dt = dt.replace(tzinfo=timezone.utc)
+    return dt.timestamp()
+
+
+def sincronizar_presenca(agora):
+    """Junta à presença em memória os clientes com pedido nas últimas PRESENCA_HORAS horas.
+    Quem está só no chat (sem pedido) continua na lista, e os eventos ainda não lidos não se perdem"""
+    posicao = tamanho_eventos()
+    hora_limite_iso = (datetime.utcnow() - timedelta(hours=PRESENCA_HORAS)).isoformat()
 
     # Busca todos os clientes que fizeram pedidos nas últimas 12h
     data = supabase.table("pedidos_finalizados") \
-        .select("id_cliente, nome, mesa") \
+        .select("id_cliente, nome, mesa, data_hora") \
         .gte("data_hora", hora_limite_iso) \
         .execute()
 
-    # Agrupa por id_cliente para evitar duplicados
-    usuarios = {}
-    for row in data.data:
-        usuarios[row["id_cliente"]] = {
-            "id_cliente": row["id_cliente"],
-            "nome": row.get("nome"),
-            "mesa": row.get("mesa")
-        }
+    with _presenca_lock:
+        usuarios = _presenca['usuarios']
+        for row in data.data or []:
+            # Nome e mesa já em memória vieram de eventos, mais novos que o pedido; visto_em é o
+            # momento do pedido, para o cliente expirar PRESENCA_HORAS depois dele
+            atual = usuarios.get(row["id_cliente"], {})
+            usuarios[row["id_cliente"]] = {
+                "id_cliente": row["id_cliente"],
+                "nome": atual.get("nome") or row.get("nome"),
+                "mesa": atual.get("mesa") or row.get("mesa"),
+                "visto_em": max(atual.get("visto_em", 0), instante_pedido(row.get("data_hora"), agora))
+            }
+        # Na primeira carga, os eventos anteriores à consulta já estão no banco
+        if _presenca['posicao'] is None:
+            _presenca['posicao'] = posicao
+        _presenca['sincronizado_em'] = time.monotonic()
+
+
+def usuarios_presentes():
+    """Lista de clientes ativos nas últimas PRESENCA_HORAS horas"""
+    agora = time.time()
+    sincronizado_em = _presenca['sincronizado_em']
+    if sincronizado_em is None or time.monotonic() - sincronizado_em > PRESENCA_SINCRONIZAR:
+        # Na primeira carga todos esperam por ela; depois, quem chega durante uma sincronização responde da memória
+        if _presenca_sincronizacao.acquire(blocking=sincronizado_em is None):
+            try:
+                if _presenca['sincronizado_em'] == sincronizado_em:
+                    sincronizar_presenca(agora)
+            finally:
+                _presenca_sincronizacao.release()
+
+    with _presenca_lock:
+        usuarios = _presenca['usuarios']
+
+        # Aplica os eventos de presença publicados desde a última leitura
+        _presenca['posicao'], eventos = ler_eventos(_presenca['posicao'], {'presenca'})
+        for _, evento in eventos:
+            dados = evento['dados']
+            anterior = usuarios.pop(dados['id_cliente'], {})
+            usuarios[dados['id_cliente']] = {
+                "id_cliente": dados['id_cliente'],
+                "nome": dados.get('nome') or anterior.get('nome'),
+                "mesa": dados.get('mesa') or anterior.get('mesa'),
+                "visto_em": agora
+            }
 
-    # Retorna apenas lista de usuários
-    return jsonify(list(usuarios.values()))
+        # Expira quem não aparece há mais de PRESENCA_HORAS
+        limite = agora - PRESENCA_HORAS * 3600
+        for id_cliente in [i for i, u in usuarios.items() if u['visto_em'] < limite]:
+            del usuarios[id_cliente]
+
+        return [{k: u[k] for k in ("id_cliente", "nome", "mesa")} for u in usuarios.values()]
+
+
+@app.route("/api/usuarios_online", methods=["GET"])
+def usuarios_online():
+    # Retorna apenas lista de usuários; ETag permite 304 quando nada mudou
+    corpo, etag = corpo_usuarios_online()
+    response = app.response_class(corpo, mimetype='application/json')
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = 'no-cache'
+    return response.make_conditional(request)
+
+
+def corpo_usuarios_online():
+    """JSON dos usuários online e o ETag dele"""
+    corpo = json.dumps(usuarios_presentes(), ensure_ascii=False, sort_keys=True)
+    return corpo, hashlib.md5(corpo.encode('utf-8')).hexdigest()
 
     
 import os
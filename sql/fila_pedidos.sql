@@ -0,0 +1,8 @@
+-- Número provisório dos pedidos que passam pela fila local (FILA_PEDIDOS=1, ver fila_pedidos.py).
+-- A fila grava com upsert ignorando duplicados nesta coluna, então reenviar um lote não duplica pedidos.
+-- Rodar uma vez no SQL Editor do Supabase antes de ligar FILA_PEDIDOS.
+
+alter table pedidos_finalizados add column if not exists id_provisorio text;
+
+create unique index if not exists pedidos_finalizados_id_provisorio_idx
+    on pedidos_finalizados (id_provisorio);
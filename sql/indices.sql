@@ -0,0 +1,12 @@
+-- Índices das consultas quentes em pedidos_finalizados.
+-- Rodar uma vez no SQL Editor do Supabase.
+
+-- /caixa/funcionario/recebimento: só pedidos em aberto (status <> 'Pago'),
+-- o índice fica do tamanho das comandas abertas e não do histórico
+create index if not exists pedidos_abertos_idx
+    on pedidos_finalizados (id_cliente, data_hora desc)
+    where status <> 'Pago';
+
+-- /pedidos/lele, /pedidos/lele_data e relatório financeiro: janelas por data_hora
+create index if not exists pedidos_data_hora_idx
+    on pedidos_finalizados (data_hora desc, pedido_numero desc);
@@ -0,0 +1,23 @@
+-- Métricas do relatório financeiro (/caixa/funcionario/relatoriofinanceiro) calculadas no banco:
+-- uma linha com a soma e as contagens, em vez de baixar total e status de cada pedido do filtro.
+-- Mesmos filtros de filtrar_pedidos em lele.py. Rodar uma vez no SQL Editor do Supabase.
+
+create or replace function totais_pedidos(
+    status_busca text default null,
+    nome_busca text default null,
+    data_inicio timestamptz default null,
+    data_fim timestamptz default null
+)
+returns table (total_vendido numeric, total_pedidos bigint, pedidos_pagos bigint)
+language sql
+stable
+as $$
+    select coalesce(sum(p.total), 0),
+           count(*),
+           count(*) filter (where p.status = 'Pago')
+    from pedidos_finalizados p
+    where (status_busca is null or p.status = status_busca)
+      and (nome_busca is null or p.nome ilike '%' || nome_busca || '%')
+      and (data_inicio is null or p.data_hora >= data_inicio)
+      and (data_fim is null or p.data_hora <= data_fim);
+$$;
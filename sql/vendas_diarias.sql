@@ -0,0 +1,84 @@
+-- Consolidado diário de vendas por produto/categoria.
+-- Mantido pelo app em /caixa/funcionario/pagar_comanda (função registrar_vendas) e lido por
+-- /caixa/funcionario/relatoriodevendas. Rodar no SQL Editor do Supabase antes de publicar o app:
+-- sem registrar_vendas, pagar_comanda grava só em vendas (com um erro no log) e vendas_diarias fica para trás.
+
+create table if not exists vendas_diarias (
+    dia date not null,
+    nome text not null,
+    categoria text not null default 'Não especificada',
+    preco numeric not null default 0,
+    quantidade integer not null default 0,
+    valor_total numeric not null default 0,
+    primary key (dia, nome, categoria)
+);
+
+create index if not exists vendas_diarias_categoria_idx on vendas_diarias (categoria, dia);
+
+-- Grava as vendas de uma comanda e soma ao consolidado na mesma transação: vendas e vendas_diarias
+-- nunca ficam diferentes (ou as duas gravam, ou nenhuma). Incremento atômico, seguro com vários workers.
+-- linhas: [{"nome": "...", "categoria": "...", "preco": 10, "data_hora": "2025-01-31T22:10:00-03:00"}]
+-- Devolve as linhas inseridas em vendas.
+create or replace function registrar_vendas(linhas jsonb)
+returns setof vendas
+language sql
+as $$
+    with inseridas as (
+        insert into vendas (nome, categoria, preco, data_hora)
+        select l.nome, l.categoria, l.preco, l.data_hora
+        from jsonb_populate_recordset(null::vendas, linhas) as l
+        returning *
+    ), consolidado as (
+        insert into vendas_diarias (dia, nome, categoria, preco, quantidade, valor_total)
+        select (i.data_hora::timestamptz at time zone 'America/Sao_Paulo')::date,
+               i.nome,
+               coalesce(i.categoria, 'Não especificada'),
+               max(i.preco),
+               count(*),
+               sum(i.preco)
+        from inseridas i
+        group by 1, 2, 3
+        on conflict (dia, nome, categoria) do update
+            set preco = excluded.preco,
+                quantidade = vendas_diarias.quantidade + excluded.quantidade,
+                valor_total = vendas_diarias.valor_total + excluded.valor_total
+    )
+    select * from inseridas;
+$$;
+
+-- Relatório agrupado por produto no período: uma linha por produto, não por venda.
+create or replace function relatorio_vendas(
+    data_inicio date default null,
+    data_fim date default null,
+    nome_busca text default null,
+    categoria_busca text default null
+)
+returns table (nome text, categoria text, preco numeric, quantidade bigint, valor_total numeric)
+language sql
+stable
+as $$
+    select v.nome,
+           min(v.categoria),
+           max(v.preco),
+           sum(v.quantidade),
+           sum(v.valor_total)
+    from vendas_diarias v
+    where (data_inicio is null or v.dia >= data_inicio)
+      and (data_fim is null or v.dia <= data_fim)
+      and (nome_busca is null or v.nome ilike '%' || nome_busca || '%')
+      and (categoria_busca is null or v.categoria = categoria_busca)
+    group by v.nome
+    order by sum(v.valor_total) desc;
+$$;
+
+-- Carga inicial a partir do histórico já existente em vendas (rodar uma única vez).
+insert into vendas_diarias (dia, nome, categoria, preco, quantidade, valor_total)
+select (data_hora at time zone 'America/Sao_Paulo')::date,
+       nome,
+       coalesce(categoria, 'Não especificada'),
+       max(preco),
+       count(*),
+       sum(preco)
+from vendas
+group by 1, 2, 3
+on conflict (dia, nome, categoria) do nothing;
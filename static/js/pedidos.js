@@ -0,0 +1,61 @@
+// Mantém um Map de pedidos (pedido_numero -> pedido) em dia com o servidor e chama aoMudar() a cada mudança.
+// push = true: eventos de /pedidos/eventos (só o painel da cozinha logado, com PEDIDOS_PUSH=1 no servidor).
+// Senão: polling de /pedidos/lele_data?since=<maior número conhecido>, que só traz os pedidos novos e o
+// status dos já vistos. Devolve uma função que força uma atualização (usada depois das ações do painel).
+const PEDIDOS_INTERVALO = 10000;
+
+function sincronizarPedidos(pedidos, aoMudar, push) {
+    if (push) {
+        const eventos = new EventSource('/pedidos/eventos');
+        const juntar = e => {
+            const dados = JSON.parse(e.data);
+            pedidos.set(dados.pedido_numero, { ...pedidos.get(dados.pedido_numero), ...dados });
+            aoMudar();
+        };
+        eventos.addEventListener('novo', juntar);
+        eventos.addEventListener('status', e => {
+            if (pedidos.has(JSON.parse(e.data).pedido_numero)) juntar(e);
+        });
+        eventos.addEventListener('observacao', e => {
+            if (pedidos.has(JSON.parse(e.data).pedido_numero)) juntar(e);
+        });
+        eventos.addEventListener('excluido', e => {
+            pedidos.delete(JSON.parse(e.data).pedido_numero);
+            aoMudar();
+        });
+        return () => {};
+    }
+
+    let cursor = Math.max(0, ...pedidos.keys());
+    let vistos = null;  // números da janela na resposta anterior; os que sumirem foram excluídos
+
+    async function atualizar() {
+        if (document.visibilityState === 'hidden') return;
+        try {
+            const response = await fetch(`/pedidos/lele_data?since=${cursor}`);
+            if (!response.ok) return;
+            const dados = await response.json();
+
+            dados.novos.forEach(p => pedidos.set(p.pedido_numero, p));
+            const atuais = new Set();
+            dados.status.forEach(s => {
+                atuais.add(s.pedido_numero);
+                const p = pedidos.get(s.pedido_numero);
+                if (p) Object.assign(p, s);
+            });
+            if (vistos) vistos.forEach(numero => { if (!atuais.has(numero)) pedidos.delete(numero); });
+            vistos = atuais;
+            cursor = dados.cursor;
+            aoMudar();
+        } catch (err) {
+            console.error("Erro ao atualizar pedidos:", err);
+        }
+    }
+
+    setInterval(atualizar, PEDIDOS_INTERVALO);
+    document.addEventListener('visibilitychange', () => {
+        if (document.visibilityState === 'visible') atualizar();
+    });
+    atualizar();
+    return atualizar;
+}
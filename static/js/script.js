@@ -1,5 +1,7 @@
 var carrinho = carrinho || [];
 let chatAtual = null;
+let ultimaMensagemId = null;   // cursor: id da última mensagem exibida no chat atual
+let eventosChat = null;        // EventSource do chat atual (modo push)
 
 // ================== DOM READY ==================
 document.addEventListener('DOMContentLoaded', () => {
@@ -37,8 +39,11 @@ document.addEventListener('DOMContentLoaded', () => {
     carregarUsuariosOnline();
     setInterval(carregarUsuariosOnline, 30000);
 
-    // Atualizar mensagens a cada 5s
-    setInterval(carregarMensagens, 10000);
+    // Atualizar mensagens a cada 10s (só as novas, pelo cursor); no modo push o servidor envia
+    setInterval(() => {
+        if (!eventosChat) carregarMensagens();
+        atualizarTempos();
+    }, 10000);
 
     // Abre chat Social Chat por padrão
     abrirChat('social', 'Social Chat');
@@ -51,12 +56,72 @@ function showCategoria(categoria) {
     if (el) el.style.display = 'block';
 }
 
+// Versão do cardápio exibido e preços vindos de /api/cardapio (têm prioridade sobre os da página)
+let versaoCardapio = null;
+const precosCardapio = {};
+
+document.addEventListener('DOMContentLoaded', () => {
+    const conteudo = document.querySelector('.content[data-versao]');
+    if (!conteudo) return;
+    versaoCardapio = conteudo.dataset.versao;
+    // Só as trocas de disponível/esgotado desde a versão exibida (poucos bytes; 304 quando nada mudou)
+    setInterval(atualizarCardapio, 60000);
+    document.addEventListener('visibilitychange', () => {
+        if (document.visibilityState === 'visible') atualizarCardapio();
+    });
+});
+
+async function atualizarCardapio() {
+    if (!versaoCardapio || document.visibilityState === 'hidden') return;
+    try {
+        const response = await fetch(`/api/cardapio?desde=${encodeURIComponent(versaoCardapio)}`);
+        if (!response.ok) return;
+        const dados = await response.json();
+        if (dados.itens) {
+            // Mudou mais do que a disponibilidade (ou o servidor não conhecia a versão): veio o cardápio inteiro
+            const campo = Object.fromEntries(dados.campos.map((nome, i) => [nome, i]));
+            dados.itens.forEach(item => {
+                precosCardapio[item[campo.id]] = item[campo.preco];
+                aplicarPreco(item[campo.id], item[campo.preco]);
+                aplicarDisponibilidade(item[campo.id], item[campo.disponivel]);
+            });
+        } else {
+            Object.entries(dados.disponivel).forEach(([id, disponivel]) => aplicarDisponibilidade(id, disponivel));
+        }
+        versaoCardapio = dados.versao;
+    } catch (err) {
+        console.error("Erro ao atualizar cardápio:", err);
+    }
+}
+
+function cardDoItem(id) {
+    return document.querySelector(`.item-card[data-id="${CSS.escape(String(id))}"]`);
+}
+
+// O preço mostrado no card é o mesmo que vai para o carrinho
+function aplicarPreco(id, preco) {
+    const texto = cardDoItem(id)?.querySelector('.preco');
+    if (texto) texto.textContent = `R$ ${Number(preco).toFixed(2)}`;
+}
+
+function aplicarDisponibilidade(id, disponivel) {
+    const card = cardDoItem(id);
+    if (!card) return;
+    const img = card.querySelector('img');
+    if (img) img.style.filter = disponivel ? '' : 'grayscale(100%)';
+    const botao = card.querySelector('button.adicionar');
+    const aviso = card.querySelector('.indisponivel');
+    if (botao) botao.hidden = !disponivel;
+    if (aviso) aviso.hidden = disponivel;
+}
+
 function adicionarAoCarrinho(id, preco, nome, categoria) {
     let sabor = '';
     if (categoria === 'PÃO COM CHURRAS') {
         const select = document.getElementById(`sabor-${nome}`);
         sabor = select ? select.value : '';
     }
+    if (id in precosCardapio) preco = precosCardapio[id];
     carrinho.push({ id, preco: parseFloat(preco), nome, sabor });
     atualizarCarrinho();
     abrirCarrinhoPopup();
@@ -156,33 +221,59 @@ function minutosPassados(ts) {
     return Math.floor((Date.now() - new Date(ts)) / 60000);
 }
 
+function atualizarTempos() {
+    document.querySelectorAll("#messages .time_date[data-created-at]").forEach(span => {
+        span.textContent = `${minutosPassados(span.dataset.createdAt)} min`;
+    });
+}
+
+function adicionarMensagem(m) {
+    const container = document.getElementById("messages");
+    if (!container || m.chat_id && m.chat_id !== chatAtual) return;
+    // Ignora mensagem já exibida (pode chegar pelo push e pelo polling)
+    if (m.id != null && container.querySelector(`[data-id="${m.id}"]`)) return;
+
+    const div = document.createElement("div");
+    div.className = "message " + (m.id_cliente === meuId ? "self outgoing_msg" : "incoming_msg");
+    if (m.id != null) div.dataset.id = m.id;
+    div.innerHTML = `
+        <div class="${m.id_cliente === meuId ? 'sent_msg' : 'received_withd_msg'}">
+            <p><strong>${m.nome}</strong><br>${m.mensagem}</p>
+            <span class="time_date" data-created-at="${m.created_at}">${minutosPassados(m.created_at)} min</span>
+        </div>
+    `;
+    container.appendChild(div);
+    container.scrollTop = container.scrollHeight;
+    if (m.id != null && (ultimaMensagemId === null || m.id > ultimaMensagemId)) ultimaMensagemId = m.id;
+}
+
 async function carregarMensagens() {
     if (!chatAtual) return;
+    const chatId = chatAtual;
     try {
-        const res = await fetch(`/api/mensagens?chat_id=${chatAtual}`);
+        let url = `/api/mensagens?chat_id=${encodeURIComponent(chatId)}`;
+        if (ultimaMensagemId !== null) url += `&after_id=${ultimaMensagemId}`;
+        const res = await fetch(url);
         if (!res.ok) throw new Error(`Erro HTTP ${res.status}`);
         const msgs = await res.json();
-        const container = document.getElementById("messages");
-        if (!container) return;
-        container.innerHTML = "";
-
-        msgs.forEach(m => {
-            const div = document.createElement("div");
-            div.className = "message " + (m.id_cliente === meuId ? "self outgoing_msg" : "incoming_msg");
-            div.innerHTML = `
-                <div class="${m.id_cliente === meuId ? 'sent_msg' : 'received_withd_msg'}">
-                    <p><strong>${m.nome}</strong><br>${m.mensagem}</p>
-                    <span class="time_date">${minutosPassados(m.created_at)} min</span>
-                </div>
-            `;
-            container.appendChild(div);
-        });
-        container.scrollTop = container.scrollHeight;
+        if (chatId !== chatAtual) return;  // trocou de chat durante a requisição
+        msgs.forEach(adicionarMensagem);
     } catch (err) {
         console.error("Erro ao carregar mensagens:", err);
     }
 }
 
+function conectarEventosChat() {
+    if (eventosChat) eventosChat.close();
+    eventosChat = null;
+    if (typeof chatPush === "undefined" || !chatPush || !window.EventSource) return;
+
+    eventosChat = new EventSource(`/api/mensagens/eventos?chat_id=${encodeURIComponent(chatAtual)}`);
+    eventosChat.addEventListener("mensagem", e => adicionarMensagem(JSON.parse(e.data)));
+    // Ao reconectar, busca pelo cursor o que possa ter chegado enquanto estava desconectado
+    eventosChat.addEventListener("open", () => carregarMensagens());
+}
+
 async function enviarMensagem() {
     const msgInput = document.getElementById("msgInput");
     if (!msgInput) return;
@@ -202,10 +293,12 @@ async function enviarMensagem() {
     });
 
     msgInput.value = "";
+    if (!eventosChat) carregarMensagens();
 }
 
 function abrirChat(chatId, nomeContato = null) {
     chatAtual = chatId;
+    ultimaMensagemId = null;
     const container = document.getElementById("messages");
     if (container) container.innerHTML = "";
 
@@ -218,6 +311,7 @@ function abrirChat(chatId, nomeContato = null) {
     }
 
     carregarMensagens();
+    conectarEventosChat();
 
     // Fecha a sidebar quando abre um chat
     const sidebar = document.querySelector(".sidebar");